@@ -20,7 +20,12 @@ from pcbdl.small_parts import *
 from pcbdl.defined_at import *
 from pcbdl.context import *
 
+from pcbdl.pipeline import *
+from pcbdl.bom import *
+from pcbdl.snapshot import *
 from pcbdl.allegro import *
+from pcbdl.diff import *
 from pcbdl.html import *
 
+from pcbdl.partition import *
 from pcbdl.netlistsvg import *
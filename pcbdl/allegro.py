@@ -13,58 +13,54 @@
 # limitations under the License.
 
 """
-Allegro(R) "third party" netlist format exporter.
+Allegro(R) "third party" netlist format exporter (and importer).
 """
 
-from .base import Part, PartInstancePin, Net, Plugin
+from .base import Part, PartInstancePin, Net, Pin
 from .context import *
+from .pipeline import Sink, export
 
 import collections
+import concurrent.futures
 from datetime import datetime
+import hashlib
+import io
 import itertools
 import os
+import re
 import shutil
 import pprint
+import sys
+import types
 
 """Allegro "third party" format"""
-__all__ = ["generate_netlist"]
+__all__ = ["generate_netlist", "AllegroNetlistSink", "read_netlist", "import_netlist"]
 
 def join_across_lines(iterator, count=10):
-    iterator = tuple(iterator)
-    grouped_generator = (iterator[i:i + count] for i in range(0, len(iterator), count))
-    return ' ,\n'.join(' '.join(line) for line in grouped_generator)
-
-@Plugin.register(Net)
-class NetlistNet(Plugin):
-    @property
-    def line(self):
-        net = self.instance
-        name = net.name
-        pins = (f"{pin.part!r}.{number}" for pin in net.connections for number in pin.numbers)
-        return "%s ; %s" % (
-            name,
-            join_across_lines(pins),
-        )
-
-def netlist_generator(context, grouped_parts):
-    yield "(NETLIST)"
-    yield "(CREATED BY PCBDL)"
-    yield "(%s)" % (datetime.now().strftime("%a %b %d %H:%M:%S %Y"))
-    yield ""
+    return ' ,\n'.join(_lines_of(iterator, count))
 
-    yield "$PACKAGES"
-    for (package, part_number), parts_list in grouped_parts.items():
-        yield "'%s' ! '%s' ; %s" % (
-            package, part_number,
-            " ".join(map(repr, parts_list))
-        )
-    yield ""
+def _lines_of(iterator, count):
+    """Groups of count elements from the iterator, space separated, without looking at the whole iterator at once."""
+    iterator = iter(iterator)
+    while True:
+        line = tuple(itertools.islice(iterator, count))
+        if not line:
+            return
+        yield ' '.join(line)
 
-    yield "$NETS"
-    for net in context.net_list:
-        yield net.plugins[NetlistNet].line
+def _net_line(name, pins):
+    """pins are "REFDES.NUMBER" strings"""
+    return "%s ; %s" % (name, join_across_lines(pins))
 
-    yield "$END"
+def _package_line(package, part_number, refdeses):
+    return "'%s' ! '%s' ; %s" % (package, part_number, " ".join(refdeses))
+
+def _header_lines(include_date):
+    yield "(NETLIST)"
+    yield "(CREATED BY PCBDL)"
+    if include_date:
+        yield "(%s)" % (datetime.now().strftime("%a %b %d %H:%M:%S %Y"))
+    yield ""
 
 def generate_device_file_contents(part):
     hardware_pins = []
@@ -95,37 +91,363 @@ END
 
     return contents
 
-def generate_netlist(output_location, context=global_context):
-    # Clear it and make a new one
+def _file_digest(filename):
+    try:
+        with open(filename, "rb") as f:
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.read(io.DEFAULT_BUFFER_SIZE), b""):
+                h.update(chunk)
+            return h.digest()
+    except FileNotFoundError:
+        return None
+
+def write_file_if_changed(filename, write, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Calls write(f) to fill a temporary file next to filename. It only replaces filename (with an atomic rename)
+    if the bytes are different, otherwise the old file (and its timestamp) stays untouched.
+
+    Returns True if filename was replaced.
+    """
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        with open(tmp_filename, "w", buffering=buffer_size) as f:
+            write(f)
+        return _replace_if_changed(tmp_filename, filename)
+    except BaseException:
+        _remove_if_exists(tmp_filename)
+        raise
+
+def _replace_if_changed(tmp_filename, filename):
+    if _file_digest(tmp_filename) == _file_digest(filename):
+        os.remove(tmp_filename)
+        return False
+
+    os.replace(tmp_filename, filename)
+    return True
+
+def _remove_if_exists(filename):
     try:
-        shutil.rmtree(output_location)
+        os.remove(filename)
     except FileNotFoundError:
         pass
-    os.mkdir(output_location)
 
-    grouped_parts = collections.defaultdict(list)
-    for part in context.parts_list:
+def _remove_others(location, keep):
+    """Removes everything in location that's not in keep, so it looks like it was freshly generated."""
+    for name in os.listdir(location):
+        if name in keep:
+            continue
+        path = os.path.join(location, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+class DeviceFileError(Exception):
+    """Some device files couldn't be generated. errors is {device file name: exception}, in part order."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Couldn't generate %d device file(s):\n%s" % (len(errors),
+            "\n".join(" %s: %r" % (device_file, error) for device_file, error in errors.items())))
+
+def write_device_files(device_location, device_parts, workers=None):
+    """
+    Writes {device file name: part} in device_location, returns the list of replaced files.
+
+    Device files can be formatted and written by a pool of worker threads, the output doesn't depend on it.
+    If some of them fail, :class:`DeviceFileError` is raised after all the others are done.
+    """
+    def write_device_file(device_file, part):
+        device_file_contents = generate_device_file_contents(part)
+        device_filename = os.path.join(device_location, device_file)
+        if write_file_if_changed(device_filename, lambda f: f.write(device_file_contents)):
+            return device_filename
+
+    results = [] # [(device_file, changed filename or None, exception or None)] in part order
+    if workers is None or workers <= 1:
+        for device_file, part in device_parts.items():
+            try:
+                results.append((device_file, write_device_file(device_file, part), None))
+            except Exception as e:
+                results.append((device_file, None, e))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(device_file, executor.submit(write_device_file, device_file, part))
+                for device_file, part in device_parts.items()]
+            for device_file, future in futures:
+                error = future.exception()
+                results.append((device_file, None if error else future.result(), error))
+
+    changed_files = []
+    errors = collections.OrderedDict()
+    for device_file, changed_filename, error in results: # in the same order regardless of the workers
+        if error is not None:
+            errors[device_file] = error
+        elif changed_filename is not None:
+            changed_files.append(changed_filename)
+    if errors:
+        raise DeviceFileError(errors)
+    return changed_files
+
+class AllegroNetlistSink(Sink):
+    """
+    :func:`export<pcbdl.pipeline.export>` sink for the Allegro netlist and device files, see :func:`generate_netlist`.
+    end() returns the list of replaced files.
+    """
+    NETLIST_FILE = "frompcbdl.netlist.rpt"
+
+    def __init__(self, output_location, buffer_size=io.DEFAULT_BUFFER_SIZE, include_date=True, workers=None):
+        self.output_location = output_location
+        self.buffer_size = buffer_size
+        self.include_date = include_date
+        self.workers = workers
+
+    def begin(self, context):
+        self.device_location = os.path.join(self.output_location, "devices")
+        os.makedirs(self.device_location, exist_ok=True)
+
+        self.grouped_parts = collections.OrderedDict() # {(package, part_number): [PartRecord]}
+
+        self.netlist_filename = os.path.join(self.output_location, self.NETLIST_FILE)
+        self.tmp_filename = "%s.%d.tmp" % (self.netlist_filename, os.getpid())
+        self.f = open(self.tmp_filename, "w", buffering=self.buffer_size)
+        self._write_lines(_header_lines(self.include_date))
+
+    def _write_lines(self, lines):
+        for line in lines:
+            self.f.write(line)
+            self.f.write("\n")
+
+    def part(self, part):
         key = (part.package, part.part_number)
-        grouped_parts[key].append(part)
+        try:
+            self.grouped_parts[key].append(part)
+        except KeyError:
+            self.grouped_parts[key] = [part]
 
-    netlist_contents = "\n".join(netlist_generator(context, grouped_parts))
+    def parts_done(self):
+        self.f.write("$PACKAGES\n")
+        self._write_lines(_package_line(package, part_number, (part.refdes for part in parts))
+            for (package, part_number), parts in self.grouped_parts.items())
+        self.f.write("\n$NETS\n")
 
-    netlist_filename = os.path.join(output_location, "frompcbdl.netlist.rpt")
-    with open(netlist_filename, "w") as f:
-        f.write(netlist_contents)
+    def net(self, net):
+        self.f.write(_net_line(net.name, ("%s.%s" % pin for pin in net.pins)))
+        self.f.write("\n")
 
-    # Generate device files
-    device_location = os.path.join(output_location, "devices")
-    os.mkdir(device_location)
-    for parts in grouped_parts.values():
-        # Not sure if this is ok
-        # we're assuming that parts with the same package and part
-        # number have the same part class yielding in the same
-        # ammount of pin_count
-        part = parts[0]
+    def end(self):
+        self.f.write("$END")
+        self.f.close()
 
-        device_file_contents = generate_device_file_contents(part)
+        changed_files = []
+        if _replace_if_changed(self.tmp_filename, self.netlist_filename):
+            changed_files.append(self.netlist_filename)
+
+        # Generate device files
+        device_parts = collections.OrderedDict()
+        for parts in self.grouped_parts.values():
+            # Not sure if this is ok
+            # we're assuming that parts with the same package and part
+            # number have the same part class yielding in the same
+            # ammount of pin_count
+            part = parts[0].part
+
+            # if the part number shows up with multiple packages, the last one wins
+            device_file = part.part_number + ".txt"
+            device_parts.pop(device_file, None)
+            device_parts[device_file] = part
+        changed_files += write_device_files(self.device_location, device_parts, self.workers)
+
+        # Clean up whatever is left over from older designs
+        _remove_others(self.output_location, {self.NETLIST_FILE, "devices"})
+        _remove_others(self.device_location, device_parts.keys())
+
+        return changed_files
+
+    def abort(self):
+        if getattr(self, "f", None) is not None:
+            self.f.close()
+            _remove_if_exists(self.tmp_filename)
+
+def generate_netlist(output_location, context=None, buffer_size=io.DEFAULT_BUFFER_SIZE, include_date=True,
+                     workers=None):
+    """
+    Generates the netlist file and device files in the output_location folder.
+
+    Only files whose contents changed are replaced, so layout tools that look at timestamps don't redo work.
+    With include_date=False unchanged designs give byte identical files. Returns the list of replaced files.
+
+    Device files can be formatted and written by a pool of worker threads, the output doesn't depend on it.
+    If some of them fail, :class:`DeviceFileError` is raised after all the others are done.
+
+    To make other outputs at the same time use :class:`AllegroNetlistSink` with :func:`export<pcbdl.pipeline.export>`.
+    """
+    sink = AllegroNetlistSink(output_location, buffer_size, include_date, workers)
+    return export([sink], context)[0]
+
+class NetlistSyntaxError(Exception):
+    pass
+
+ImportedPart = collections.namedtuple("ImportedPart", "refdes package part_number value")
+ImportedNet = collections.namedtuple("ImportedNet", "name pins") # pins: ((refdes, pin number), ...)
+ImportedNetlist = collections.namedtuple("ImportedNetlist", "header parts nets")
+"""Frozen netlist: header lines, read only {refdes: ImportedPart} and {net name: ImportedNet}, in file order."""
+
+def _logical_lines(lines):
+    """Yields (line number, line) with the lines ending in "," joined with the next one, like Allegro wraps them."""
+    pending = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip()
+        if pending:
+            line = line.lstrip()
+        else:
+            start = lineno
+        if line.endswith(","):
+            pending.append(line[:-1])
+            continue
+        if pending:
+            pending.append(line)
+            line = "".join(pending)
+            pending = []
+        yield start, line
+    if pending:
+        yield start, "".join(pending)
+
+_TOKEN_RE = re.compile(r"\s*(?:'([^']*)'|([!;])|([^\s'!;]+))")
+def _tokens(line):
+    """Quoted strings (without the quotes), "!", ";" and bare words."""
+    for quoted, separator, word in _TOKEN_RE.findall(line):
+        yield quoted or separator or word
+
+def _split_line(lineno, line):
+    """Returns ([fields separated by !], [words after ;])."""
+    if "'" not in line:
+        head, separator, tail = line.partition(";")
+        fields = [field.strip() for field in head.split("!")]
+        words = tail.split()
+    else:
+        fields, words = [""], None
+        for token in _tokens(line):
+            if words is not None:
+                words.append(token)
+            elif token == ";":
+                words = []
+            elif token == "!":
+                fields.append("")
+            else:
+                fields[-1] += token
+        separator = ";" if words is not None else ""
+    if not separator:
+        raise NetlistSyntaxError("line %d: missing ';' in %r" % (lineno, line))
+    return fields, words
+
+def parse_netlist(lines):
+    """
+    Reads a third party netlist one line at a time, yields an :class:`ImportedPart` for each refdes
+    in ``$PACKAGES`` and an :class:`ImportedNet` for each net in ``$NETS``, in file order.
+
+    Only one (unwrapped) line is looked at at a time, so lines can come straight from a big open file.
+    Header lines are yielded as plain strings.
+    """
+    section = None
+    for lineno, line in _logical_lines(lines):
+        if not line:
+            continue
+
+        if line.startswith("$"):
+            section = line.split()[0].upper()
+            if section == "$END":
+                return
+            continue
+
+        if section is None:
+            yield line
+            continue
+
+        fields, words = _split_line(lineno, line)
+        if section == "$PACKAGES":
+            if len(fields) < 2:
+                raise NetlistSyntaxError("line %d: expected 'package' ! 'part number' in %r" % (lineno, line))
+            package, part_number = fields[0], fields[1]
+            value = fields[2] if len(fields) > 2 else None
+            for refdes in words:
+                yield ImportedPart(sys.intern(refdes), package, part_number, value)
+        elif section == "$NETS":
+            pins = []
+            for word in words:
+                refdes, dot, number = word.partition(".")
+                if not dot:
+                    raise NetlistSyntaxError("line %d: expected REFDES.PIN, got %r" % (lineno, word))
+                pins.append((sys.intern(refdes), sys.intern(number)))
+            yield ImportedNet(fields[0], tuple(pins))
+
+def read_netlist(filename):
+    """Reads a third party netlist file (or an already open file) into an :data:`ImportedNetlist`."""
+    if isinstance(filename, io.IOBase):
+        return _read_netlist(filename)
+    with open(filename, "r") as f:
+        return _read_netlist(f)
+
+def _read_netlist(f):
+    header, parts, nets = [], {}, {}
+    for item in parse_netlist(f):
+        if isinstance(item, ImportedPart):
+            if item.refdes in parts:
+                raise NetlistSyntaxError("refdes %s shows up more than once" % item.refdes)
+            parts[item.refdes] = item
+        elif isinstance(item, ImportedNet):
+            if item.name in nets:
+                raise NetlistSyntaxError("net %s shows up more than once" % item.name)
+            nets[item.name] = item
+        else:
+            header.append(item)
+    return ImportedNetlist(tuple(header), types.MappingProxyType(parts), types.MappingProxyType(nets))
+
+_imported_part_classes = {} # {(refdes prefix, pin numbers): Part subclass}
+def _imported_part_class(prefix, numbers):
+    key = (prefix, numbers)
+    try:
+        return _imported_part_classes[key]
+    except KeyError:
+        pass
+
+    cls = type("Imported%s" % prefix, (Part,), {
+        "__module__": __name__,
+        "__doc__": "Part read from a netlist, only the pin numbers are known.",
+        "REFDES_PREFIX": prefix,
+        "PINS": [Pin(number, number) for number in numbers],
+    })
+    _imported_part_classes[key] = cls
+    return cls
+
+def import_netlist(netlist, context=None):
+    """
+    Makes real :class:`Parts<pcbdl.Part>` and :class:`Nets<pcbdl.Net>` in the context from a third party netlist
+    (filename or :data:`ImportedNetlist`). The parts only have the pins that show up in the nets, named by their number.
+    """
+    if context is None:
+        context = current_context()
+    if not isinstance(netlist, ImportedNetlist):
+        netlist = read_netlist(netlist)
+
+    part_numbers = collections.OrderedDict((refdes, {}) for refdes in netlist.parts) # {refdes: {pin number: None}}
+    for net in netlist.nets.values():
+        for refdes, number in net.pins:
+            try:
+                part_numbers[refdes][number] = None
+            except KeyError:
+                raise NetlistSyntaxError("net %s connects to %s, which is not in $PACKAGES" % (net.name, refdes)) from None
+
+    with context:
+        parts = {}
+        for refdes, numbers in part_numbers.items():
+            imported = netlist.parts[refdes]
+            prefix = re.match(r"[^\d]*", refdes).group(0)
+            cls = _imported_part_class(prefix, tuple(sorted(numbers, key=lambda n: (len(n), n))))
+            kwargs = dict(refdes=refdes, package=imported.package, part_number=imported.part_number)
+            parts[refdes] = cls(imported.value, **kwargs) #defined_at: not here
+
+        for imported in netlist.nets.values():
+            net = Net(imported.name) #defined_at: not here
+            net.connect([parts[refdes].pins[number] for refdes, number in imported.pins])
 
-        device_filename = os.path.join(device_location, part.part_number + ".txt")
-        with open(device_filename, "w") as f:
-            f.write(device_file_contents)
+    return context
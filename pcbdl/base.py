@@ -12,10 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import collections
+import collections.abc
 import copy
 import enum
+import hashlib
 import itertools
+import os
+import pickle
+import sys
 __all__ = [
     "PinType", "ConnectDirection",
     "Net", "Part", "Pin"
@@ -233,6 +239,9 @@ class PinFragment(object):
         the part is told what package it is, we don't really know the pin
         number.
     """
+    part_cls = None
+    """The first :class:`Part<pcbdl.Part>` class that had this fragment in its :attr:`PINS<pcbdl.Part.PINS>`."""
+
     def __init__(self, names_or_numbers=(), names_if_numbers=None, *args, **kwargs):
         # Check if short form for the positional arguments
         if names_if_numbers is None:
@@ -443,19 +452,123 @@ class PinFragmentList(list):
     """Used as a marker that we have visited Part.PINS and converted all the elements to PinFragment."""
     def __init__(self, part_cls):
         self.part_cls = part_cls
+        self._normalized_count = 0
         list.__init__(self, part_cls.PINS)
-        for i, maybenames in enumerate(self):
+        self.normalize()
+
+    def normalize(self):
+        """Converts and postprocesses the elements added since the last time this was called."""
+        start = self._normalized_count
+        if start == len(self):
+            return
+        self._normalized_count = len(self)
+
+        part_cls = self.part_cls
+        for i in range(start, len(self)):
             # syntactic sugar, .PIN list might have only names instead of the long form Pin instances
-            if not isinstance(maybenames, Pin):
-                self[i] = PinFragment(maybenames)
+            if not isinstance(self[i], Pin):
+                self[i] = PinFragment(self[i])
+            if self[i].part_cls is None:
+                self[i].part_cls = part_cls
 
         if part_cls._postprocess_pin.__code__ == Part._postprocess_pin.__code__:
             # Let's not waste our time with a noop
             return
-        for i, _ in enumerate(self):
+        for i in range(start, len(self)):
             # do user's postprocessing
             part_cls._postprocess_pin(self[i])
 
+PIN_CACHE = os.environ.get("PCBDL_PIN_CACHE", "0") != "0"
+"""
+Let the parts with :attr:`Part.cache_pins` use the on disk pin cache, turned on with ``PCBDL_PIN_CACHE=1``
+(or by setting this to True before the parts are used).
+
+The cache files are pickles, loading one runs whatever code is in it. Only turn this on if the cache files
+(see :data:`PIN_CACHE_LOCATION`) can't be written by anyone you don't trust.
+"""
+
+PIN_CACHE_LOCATION = os.environ.get("PCBDL_PIN_CACHE_LOCATION")
+"""
+Folder for the pin cache files (``<module>.pcbdl-pins.pickle``). If None they go in the ``__pycache__``
+folder next to each library module.
+"""
+
+class _PinCache(object):
+    """
+    On disk cache of merged pin tables, for parts with :attr:`Part.cache_pins` set, if :data:`PIN_CACHE` is on.
+
+    It's stored as ``{class qualname: (fingerprint of all the PINS fragments, [PartClassPin])}``,
+    see :data:`PIN_CACHE_LOCATION` for where.
+    """
+    _files = {} # {filename: {qualname: (fingerprint, pins)}}
+    _dirty = set()
+
+    @staticmethod
+    def filename(part_cls):
+        if PIN_CACHE_LOCATION is not None:
+            return os.path.join(PIN_CACHE_LOCATION, part_cls.__module__ + ".pcbdl-pins.pickle")
+
+        module = sys.modules.get(part_cls.__module__)
+        source = getattr(module, "__file__", None)
+        if source is None:
+            return None
+        directory, basename = os.path.split(source)
+        return os.path.join(directory, "__pycache__", os.path.splitext(basename)[0] + ".pcbdl-pins.pickle")
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            return cls._files[filename]
+        except KeyError:
+            pass
+
+        try:
+            with open(filename, "rb") as f:
+                entries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            entries = {}
+        cls._files[filename] = entries
+        return entries
+
+    @classmethod
+    def resolve(cls, part_cls, cls_list):
+        filename = cls.filename(part_cls)
+        qualname = part_cls.__qualname__
+        if filename is None or "<locals>" in qualname:
+            # can't tell apart classes made at runtime, don't bother
+            return _resolve_pins(cls_list)
+
+        fingerprint = hashlib.md5(repr([(c.__qualname__, c.PINS) for c in cls_list]).encode("utf8")).hexdigest()
+        entries = cls.load(filename)
+        try:
+            cached_fingerprint, pins = entries[qualname]
+            if cached_fingerprint == fingerprint:
+                return pins
+        except KeyError:
+            pass
+
+        pins = _resolve_pins(cls_list)
+        entries[qualname] = (fingerprint, pins)
+        if not cls._dirty:
+            atexit.register(cls.save)
+        cls._dirty.add(filename)
+        return pins
+
+    @classmethod
+    def save(cls):
+        for filename in cls._dirty:
+            try:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                with open(filename + ".tmp", "wb") as f:
+                    pickle.dump(cls._files[filename], f)
+                os.replace(filename + ".tmp", filename)
+            except OSError:
+                pass # it's just a cache
+        cls._dirty.clear()
+
+def _resolve_pins(cls_list):
+    return [PinFragment.resolve(f) for f in PinFragment.gather_fragments(cls_list)]
+
 class Part(object):
     """
     This is the :ref:`base class<python:tut-inheritance>` for any new Part the writer of a schematic or a part librarian has to make. ::
@@ -572,17 +685,42 @@ class Part(object):
 
         Plugin.init(self)
 
+    cache_pins = False
+    """
+    Set this to True (probably on a base class of a big part library) to save the merged pins of each part
+    on disk, so later runs don't need to merge all the :attr:`PINS` fragments again.
+    Only used if :data:`PIN_CACHE<pcbdl.base.PIN_CACHE>` is turned on.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Process the pin list a little bit, once, as soon as the class is defined
+        if "PINS" in cls.__dict__:
+            if isinstance(cls.PINS, PinFragmentList):
+                cls.PINS.normalize()
+            else:
+                cls.PINS = PinFragmentList(cls)
+
     def _generate_pin_instances(self):
         cls_list = list(PinFragment.part_superclasses(self))
 
-        # process the pin lists a little bit
+        # process whatever might have been added to the pin lists after the classes were defined
         for cls in cls_list:
-            # but only if we didn't already do it
             if isinstance(cls.PINS, PinFragmentList):
+                cls.PINS.normalize()
                 continue
             cls.PINS = PinFragmentList(cls)
 
-        self.__class__.pins = [PinFragment.resolve(f) for f in PinFragment.gather_fragments(cls_list)]
+        # merge the pins only once per class, or again if one of the pin lists changed
+        part_cls = self.__class__
+        pins_key = tuple((id(cls.PINS), len(cls.PINS)) for cls in cls_list)
+        if part_cls.__dict__.get("_pins_key") != pins_key:
+            if part_cls.cache_pins and PIN_CACHE:
+                part_cls.pins = _PinCache.resolve(part_cls, cls_list)
+            else:
+                part_cls.pins = _resolve_pins(cls_list)
+            part_cls._pins_key = pins_key
 
         self.pins = _PinList()
         for i, part_class_pin in enumerate(self.__class__.pins):
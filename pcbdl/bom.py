@@ -0,0 +1,152 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bill of materials output (CSV or JSON).
+"""
+
+from .context import *
+from .pipeline import FileSink, export
+
+import array
+import collections
+import csv
+import json
+import re
+
+__all__ = ["generate_bom", "BOMSink"]
+
+BOMRow = collections.namedtuple("BOMRow", "quantity refdes part_number package value populated")
+
+_REFDES_RE = re.compile(r"([^?]*?)(\d+)$") # not the unassigned ones, like R?m01234
+
+def compress_refdes_ranges(refdeses, min_range=3):
+    """
+    Sorts refdeses and joins runs of consecutive numbers: ``C1, C2, C3, C4, C7`` -> ``C1-C4, C7``.
+    Runs shorter than min_range are left alone.
+    """
+    group = _BOMGroup()
+    for refdes in refdeses:
+        group.add(refdes)
+    return group.refdes_string(min_range)
+
+class _BOMGroup(object):
+    """
+    Refdeses of a BOM line, only the numbers are kept (in an array per prefix and zero padded width,
+    so C01 and C001 come back as they were).
+    """
+    __slots__ = ("quantity", "numbers", "others")
+
+    def __init__(self):
+        self.quantity = 0
+        self.numbers = {} # {(prefix, width or 0 if not zero padded): array of numbers}
+        self.others = [] # refdeses that don't end in a number
+
+    def add(self, refdes):
+        self.quantity += 1
+        match = _REFDES_RE.match(refdes)
+        if match is None:
+            self.others.append(refdes)
+            return
+        prefix, number = match.groups()
+        key = (prefix, len(number) if len(number) > 1 and number.startswith("0") else 0)
+        try:
+            self.numbers[key].append(int(number))
+        except KeyError:
+            self.numbers[key] = array.array("q", (int(number),))
+
+    def ranges(self, min_range=3):
+        for prefix, width in sorted(self.numbers):
+            numbers = sorted(self.numbers[prefix, width])
+            start = 0
+            for i in range(1, len(numbers) + 1):
+                if i < len(numbers) and numbers[i] == numbers[i - 1] + 1:
+                    continue
+                if i - start >= min_range:
+                    yield "%s%0*d-%s%0*d" % (prefix, width, numbers[start], prefix, width, numbers[i - 1])
+                else:
+                    for number in numbers[start:i]:
+                        yield "%s%0*d" % (prefix, width, number)
+                start = i
+        yield from sorted(self.others)
+
+    def refdes_string(self, min_range=3):
+        return ", ".join(self.ranges(min_range))
+
+class BOMIndex(object):
+    """Parts grouped in BOM lines by (part_number, package, value, populated), in order of first appearance."""
+    def __init__(self):
+        self.groups = {} # {(part_number, package, value, populated): _BOMGroup}
+
+    def add(self, part):
+        """part can be a :class:`Part<pcbdl.Part>` or a :class:`PartRecord<pcbdl.pipeline.PartRecord>`."""
+        key = (part.part_number, getattr(part, "package", None), part.value, part.populated)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _BOMGroup()
+        group.add(part.refdes)
+
+    def rows(self, min_range=3):
+        """Yields a :data:`BOMRow` per BOM line."""
+        for (part_number, package, value, populated), group in self.groups.items():
+            yield BOMRow(group.quantity, group.refdes_string(min_range), part_number, package, value, populated)
+
+def write_bom_csv(f, rows):
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(BOMRow._fields)
+    for row in rows:
+        writer.writerow(row)
+
+def write_bom_json(f, rows):
+    """A JSON list with an object per row, written one row at a time."""
+    separator = "[\n"
+    for row in rows:
+        f.write(separator)
+        f.write(json.dumps(row._asdict()))
+        separator = ",\n"
+    f.write("]\n" if separator != "[\n" else "[]\n")
+
+_BOM_WRITERS = {
+    "csv": write_bom_csv,
+    "json": write_bom_json,
+}
+
+class BOMSink(FileSink):
+    """:func:`export<pcbdl.pipeline.export>` sink for the BOM, see :func:`generate_bom`."""
+    def __init__(self, output, format="csv", min_range=3):
+        super().__init__(output)
+        if format not in _BOM_WRITERS:
+            raise ValueError("Unknown BOM format %r, it can be one of %s" % (format, ", ".join(_BOM_WRITERS)))
+        self.format = format
+        self.min_range = min_range
+
+    def begin(self, context):
+        super().begin(context)
+        self.index = BOMIndex()
+
+    def part(self, part):
+        self.index.add(part)
+
+    def end(self):
+        _BOM_WRITERS[self.format](self.f, self.index.rows(self.min_range))
+        super().end()
+
+def generate_bom(output, context=None, format="csv", min_range=3):
+    """
+    Writes the bill of materials of the context to output (a filename or an open file) as "csv" or "json".
+
+    Parts with the same part number, package, value and populated-ness share a line, their refdeses get
+    compressed in ranges (``C1-C40``) when there's at least min_range of them in a row.
+    """
+    export([BOMSink(output, format, min_range)], context)
@@ -13,14 +13,15 @@
 # limitations under the License.
 
 from .base import Net, Part, Plugin
-from .defined_at import grab_nearby_lines
+from .defined_at import grab_nearby_lines, label_variable_names, require_source_tracking
+import array
 import collections
 import csv
 import hashlib
 
 __all__ = [
-    "Context",
-    "global_context", "nets",
+    "Context", "Variant",
+    "global_context", "nets", "current_context",
 ]
 
 class RefdesRememberer:
@@ -141,6 +142,69 @@ class RefdesRememberer:
                 row["refdes"] = refdes
                 writer.writerow(row)
 
+class Variant(object):
+    """
+    A build variant (SKU) of a :class:`Context`: which parts are populated and which values are different
+    from what the schematic says, without running the schematic again.
+
+    Only the differences are stored, as bitsets (python ints, one bit per part in
+    :attr:`Context.parts_list` order) and an array of indexes in a table of the new values.
+    """
+    def __init__(self, context, name, base=None):
+        self.context = context
+        self.name = name
+
+        self._depopulated = 0 if base is None else base._depopulated
+        self._populated = 0 if base is None else base._populated
+        self._values = [] if base is None else list(base._values) # table of the override values
+        self._value_indexes = array.array("l") if base is None else array.array("l", base._value_indexes)
+
+    def __repr__(self):
+        return "Variant(%r)" % self.name
+
+    def _index(self, part):
+        return self.context.part_index(part)
+
+    def depopulate(self, *parts):
+        for part in parts:
+            bit = 1 << self._index(part)
+            self._depopulated |= bit
+            self._populated &= ~bit
+
+    def populate(self, *parts):
+        for part in parts:
+            bit = 1 << self._index(part)
+            self._populated |= bit
+            self._depopulated &= ~bit
+
+    def set_value(self, part, value):
+        i = self._index(part)
+        if len(self._value_indexes) <= i:
+            self._value_indexes.extend([-1] * (i + 1 - len(self._value_indexes)))
+        try:
+            value_index = self._values.index(value)
+        except ValueError:
+            value_index = len(self._values)
+            self._values.append(value)
+        self._value_indexes[i] = value_index
+
+    def is_populated(self, part, i=None):
+        """If the part is populated in this variant. i is the index of the part, if it's already known."""
+        bit = 1 << (self._index(part) if i is None else i)
+        if self._depopulated & bit:
+            return False
+        if self._populated & bit:
+            return True
+        return part.populated
+
+    def value(self, part, i=None):
+        """The value of the part in this variant. i is the index of the part, if it's already known."""
+        if i is None:
+            i = self._index(part)
+        if i < len(self._value_indexes) and self._value_indexes[i] >= 0:
+            return self._values[self._value_indexes[i]]
+        return part.value
+
 class Context(object):
     def __init__(self, name = ""):
         self.name = name
@@ -149,15 +213,62 @@ class Context(object):
         self.parts_list = []
         self.named_nets = collections.OrderedDict()
 
+        self._part_indexes = {} # {part: index in parts_list}
+        self.variants = collections.OrderedDict()
+        """{name: :class:`Variant`}"""
+
+        self._outer_contexts = [] # what global_context was before each __enter__
+
+    def __enter__(self):
+        """
+        New Nets and Parts go in this context instead of :data:`global_context` until the ``with`` block ends::
+
+            with Context("board") as board:
+                Net("VCC") << R("1k")
+                generate_svg() # draws board
+
+        Only ``pcbdl.context.global_context`` is switched, names imported before (like ``pcbdl.global_context``
+        and ``nets``) keep pointing at the default context. The functions taking a context use
+        :func:`current_context` when it's not given.
+        """
+        global global_context
+        self._outer_contexts.append(global_context)
+        global_context = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global global_context
+        global_context = self._outer_contexts.pop()
+
     def new_part(self, part):
-        assert(part not in self.parts_list)
+        assert(part not in self._part_indexes)
 
         if part.refdes in (other_part.refdes for other_part in self.parts_list):
             raise Exception("Cannot have more than one part with the refdes %s in %s" % (part.refdes, self))
 
         # Add to the part list
+        self._part_indexes[part] = len(self.parts_list)
         self.parts_list.append(part)
 
+    def part_index(self, part):
+        try:
+            return self._part_indexes[part]
+        except KeyError:
+            raise KeyError("%r is not in %s" % (part, self)) from None
+
+    def new_variant(self, name, base=None):
+        """
+        Makes a new :class:`Variant` of the design, starting out like the base variant (name or Variant),
+        or the design itself.
+        """
+        if name in self.variants:
+            raise Exception("Cannot have more than one variant called %s in %s" % (name, self))
+        if isinstance(base, str):
+            base = self.variants[base]
+        variant = Variant(self, name, base)
+        self.variants[name] = variant
+        return variant
+
     def new_net(self, net):
         assert(net not in self.net_list)
 
@@ -169,9 +280,12 @@ class Context(object):
         self.named_nets[net.name] = net
 
     def autoname(self, mapping_file=None):
+        label_variable_names()
+
         self.named_parts = collections.OrderedDict()
 
         if mapping_file:
+            require_source_tracking("Remembering refdeses with %s" % mapping_file)
             refdes_rememberer = RefdesRememberer(mapping_file)
 
             # Do a pass trying to remember it
@@ -305,3 +419,7 @@ class PartContext(Plugin):
 
 global_context = Context()
 nets = global_context.named_nets
+
+def current_context():
+    """The context new Nets and Parts go in right now: the innermost ``with Context()`` block's, or :data:`global_context`."""
+    return global_context
@@ -14,62 +14,246 @@
 
 from .base import Net, Part, PinFragment, Plugin
 
+import collections
+import dis
 import inspect
+import linecache
+import mmap
 import os
+import re
+import sys
+import weakref
 
-__all__ = []
+__all__ = ["SourceTrackingDisabled"]
+
+TRACK_SOURCE = os.environ.get("PCBDL_TRACK_SOURCE", "1") != "0"
+"""
+Remember where every Net/Part/Pin was created (see :class:`DefinedAt`).
+
+Can be turned off with ``PCBDL_TRACK_SOURCE=0`` (or by setting this to False before the schematic runs)
+for netlist only exports, it makes the schematic execute faster. Outputs that need to point back at the
+source code (html, refdes mapping files) will refuse to work.
+"""
+
+class SourceTrackingDisabled(Exception):
+    pass
+
+def require_source_tracking(what):
+    if not TRACK_SOURCE:
+        raise SourceTrackingDisabled("%s needs source tracking, but it's disabled (PCBDL_TRACK_SOURCE=0)." % what)
+
+class SourceCache(object):
+    """
+    Source files read by pcbdl (refdes mapping anchors, html output, class locations), shared between all of them.
+
+    Files are read through a memory map. Only the max_files most recently used ones are kept,
+    and a file gets read again if its mtime or size changed, so long running sessions stay small and fresh.
+    """
+    def __init__(self, max_files=32):
+        self.max_files = max_files
+        self._files = collections.OrderedDict() # {filename: [(mtime_ns, size), text, lines, classes]}
+
+    def _entry(self, filename):
+        filename = os.path.join(cwd, filename)
+        stat = os.stat(filename)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._files.get(filename)
+        if entry is not None and entry[0] == version:
+            self._files.move_to_end(filename)
+            return entry
+
+        with open(filename, "rb") as f:
+            if stat.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    text = str(mapped_file, "utf8") # decoded straight from the map, no bytes copy
+            else:
+                text = ""
+        text = text.replace("\r\n", "\n").replace("\r", "\n") # same as universal newlines
+
+        entry = [version, text, None, None]
+        self._files[filename] = entry
+        self._files.move_to_end(filename)
+        while len(self._files) > self.max_files:
+            self._files.popitem(last=False)
+        return entry
+
+    def text(self, filename):
+        """The whole contents of the file."""
+        return self._entry(filename)[1]
+
+    def lines(self, filename):
+        """Tuple of the lines in the file, without the newlines."""
+        entry = self._entry(filename)
+        if entry[2] is None:
+            entry[2] = tuple(entry[1].split("\n"))
+        return entry[2]
+
+    def classes(self, filename):
+        """{class __qualname__: line number of its class statement} of the file, see :func:`class_location`."""
+        entry = self._entry(filename)
+        if entry[3] is None:
+            entry[3] = _find_classes(self.lines(filename))
+        return entry[3]
+
+    def clear(self):
+        self._files.clear()
+
+_SCOPE_RE = re.compile(r"^(\s*)(?:async\s+)?(class|def)\s+(\w+)")
+def _find_classes(lines):
+    """
+    {__qualname__: line number} of the class statements in the lines, scopes are followed by indentation
+    (functions add ``.<locals>``). If the same qualname shows up more than once, the first one wins.
+    """
+    classes = {}
+    scopes = [] # [(indent, qualname prefix)]
+    for lineno, line in enumerate(lines, 1):
+        match = _SCOPE_RE.match(line)
+        if match is None:
+            continue
+        indent, kind, name = len(match.group(1)), match.group(2), match.group(3)
+        while scopes and scopes[-1][0] >= indent:
+            scopes.pop()
+        qualname = scopes[-1][1] + name if scopes else name
+        if kind == "class":
+            classes.setdefault(qualname, lineno)
+            scopes.append((indent, qualname + "."))
+        else:
+            scopes.append((indent, qualname + ".<locals>."))
+    return classes
+
+source_cache = SourceCache()
 
-source_code = {}
 def grab_nearby_lines(defined_at, range_):
     filename, lineno = defined_at.rsplit(":", 1)
     lineno = int(lineno)
 
-    if filename not in source_code:
-        with open(filename) as file:
-            source_code[filename] = tuple(file.read().split("\n"))
-
     range_ = slice(lineno - range_, lineno + range_ - 1)
 
-    return source_code[filename][range_]
+    return source_cache.lines(filename)[range_]
 
 cwd = os.getcwd()
 
-@Plugin.register((Net, Part, PinFragment))
+def _source_line(frame):
+    return linecache.getline(frame.f_code.co_filename, frame.f_lineno, frame.f_globals)
+
+def find_definition_frame():
+    """
+    Walks up the stack from a plugin's __init__ and returns the frame of the user code that created the instance.
+
+    Only the frames that need to be checked for markers get their source line looked up.
+    """
+    frame = sys._getframe(1)
+
+    # Escape the plugin architecture
+    while frame.f_code is not _plugin_init_code:
+        frame = frame.f_back
+
+    # Escape the caller function (probably the __init__ of the class that has the plugin)
+    frame = frame.f_back.f_back
+
+    # Skip #defined_at: not here code
+    while "#defined_at: not here" in _source_line(frame):
+        frame = frame.f_back
+
+    # Escape all the inheritances of that class
+    while "super()" in _source_line(frame):
+        frame = frame.f_back
+
+    # Skip #defined_at: not here code again
+    while "#defined_at: not here" in _source_line(frame):
+        frame = frame.f_back
+
+    return frame
+
+_plugin_init_code = Plugin.init.__code__
+
+_DEFINED_AT_TARGETS = (Net, Part, PinFragment)
+
+@Plugin.register(_DEFINED_AT_TARGETS)
 class DefinedAt(Plugin):
+    """
+    Remembers the code object and line number that created the instance.
+
+    The ``"file:line"`` string is only made when ``instance.defined_at`` is first read.
+    """
+    code = None
+    lineno = None
+
     def __init__(self, instance):
-        stack_trace = inspect.stack()
+        if not TRACK_SOURCE:
+            return
+
+        if isinstance(instance, PinFragment):
+            # Too many of these in part libraries to walk the stack for each, they'll point to their Part class instead
+            return
+
+        frame = find_definition_frame()
+
+        # Most variable names are figured out later, all at once, see label_variable_names()
+        _remember_unlabeled(frame)
+        volatile_names = _volatile_names(frame.f_code)
+        if volatile_names:
+            f_locals = frame.f_locals
+            label_locals_with_variable_names({name: f_locals[name] for name in volatile_names if name in f_locals})
 
-        # Escape from this function
-        stack_trace.pop(0)
+        self.code, self.lineno = frame.f_code, frame.f_lineno
 
-        # Escape the plugin architecture
-        stack_trace.pop(0)
-        stack_trace.pop(0)
+    @property
+    def defined_at(self):
+        if isinstance(self.instance, PinFragment) and TRACK_SOURCE:
+            return _class_defined_at(self.instance.part_cls)
 
-        # Escape the caller function (probably the __init__ of the class that has the plugin)
-        stack_trace.pop(0)
+        if self.code is None:
+            raise AttributeError("defined_at is not known, source tracking was disabled (PCBDL_TRACK_SOURCE=0)")
 
-        # Skip #defined_at: not here code
-        while (stack_trace[0].code_context is not None and
-            "#defined_at: not here" in stack_trace[0].code_context[0]):
-            stack_trace.pop(0)
+        filename = os.path.relpath(self.code.co_filename, cwd)
+        return '%s:%d' % (filename, self.lineno)
 
-        # Escape all the inheritances of that class
-        while (stack_trace[0].code_context is not None and
-               "super()" in stack_trace[0].code_context[0]):
-            stack_trace.pop(0)
+def class_location(cls):
+    """
+    Returns (filename, line number) of where a class was defined.
 
-        # Skip #defined_at: not here code again
-        while (stack_trace[0].code_context is not None and
-            "#defined_at: not here" in stack_trace[0].code_context[0]):
-            stack_trace.pop(0)
+    Like :func:`inspect.getsourcelines`, but the class statement is found by ``__qualname__`` in the lines
+    of :data:`source_cache` (scanned once per version of the file) instead of parsing the whole file.
+    """
+    filename = inspect.getsourcefile(cls)
+    if filename is None:
+        raise OSError("Can't find the source file for %r" % cls)
 
-        self.frame = stack_trace[0]
+    try:
+        lineno = source_cache.classes(filename)[cls.__qualname__]
+    except KeyError:
+        raise OSError("Can't find the class statement for %r in %s" % (cls, filename)) from None
+    return filename, lineno
 
-        label_locals_with_variable_names(self.frame.frame.f_locals)
+def _class_defined_at(cls):
+    if cls is None:
+        raise AttributeError("This pin fragment is not part of any Part class yet")
 
-        filename = os.path.relpath(self.frame.filename, cwd)
-        instance.defined_at = '%s:%d' % (filename, self.frame.lineno)
+    try:
+        filename, lineno = class_location(cls)
+    except (OSError, TypeError):
+        raise AttributeError("Can't find the source code for %r" % cls) from None
+    return '%s:%d' % (os.path.relpath(filename, cwd), lineno)
+
+class _LazyDefinedAt(object):
+    """Stands in for instance.defined_at until it's read, then it's cached on the instance itself."""
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        try:
+            plugin = instance.plugins[DefinedAt]
+        except (AttributeError, KeyError, TypeError):
+            raise AttributeError("%r has no defined_at" % instance)
+
+        defined_at = plugin.defined_at
+        instance.__dict__["defined_at"] = defined_at
+        return defined_at
+
+for _cls in _DEFINED_AT_TARGETS:
+    _cls.defined_at = _LazyDefinedAt()
 
 def label_locals_with_variable_names(locals_dict):
     for variable_name, instance in locals_dict.items():
@@ -80,3 +264,83 @@ def label_locals_with_variable_names(locals_dict):
             continue
 
         instance.variable_name = variable_name
+
+_STORE_OPNAMES = ("STORE_NAME", "STORE_FAST", "STORE_GLOBAL", "STORE_DEREF")
+_volatile_names_cache = weakref.WeakKeyDictionary() # {code: volatile_names}, gone with the code
+def _volatile_names(code):
+    """
+    Names the code object might point to a different object later: stored in a loop, or in more than one spot.
+
+    Those are the only ones we can't leave for label_variable_names() to find at the end.
+    """
+    try:
+        return _volatile_names_cache[code]
+    except KeyError:
+        pass
+
+    instructions = tuple(dis.get_instructions(code))
+    loops = [(instruction.argval, instruction.offset) for instruction in instructions
+        if instruction.opcode in dis.hasjrel + dis.hasjabs and instruction.argval < instruction.offset]
+
+    store_counts = collections.Counter()
+    volatile_names = {} # ordered set
+    for instruction in instructions:
+        if instruction.opname not in _STORE_OPNAMES:
+            continue
+        store_counts[instruction.argval] += 1
+        if store_counts[instruction.argval] > 1 or any(start <= instruction.offset <= end for start, end in loops):
+            volatile_names[instruction.argval] = None
+
+    volatile_names = tuple(volatile_names)
+    _volatile_names_cache[code] = volatile_names
+    return volatile_names
+
+MAX_UNLABELED_FRAMES = 1024
+"""How many frames can wait for label_variable_names(), after that it runs early to let go of them."""
+
+"""
+{frame or id(namespace): None or namespace} of what created instances since the last label_variable_names(),
+in creation order. Module and class bodies only leave their namespace (a live dict), function frames
+(whose locals are only up to date in the frame itself) are kept whole.
+"""
+_unlabeled = {}
+
+def _remember_unlabeled(frame):
+    if frame.f_code.co_flags & inspect.CO_NEWLOCALS:
+        key, namespace = frame, None
+    else:
+        namespace = frame.f_locals
+        key = id(namespace)
+
+    if key not in _unlabeled and len(_unlabeled) >= MAX_UNLABELED_FRAMES:
+        # the current frame is left for later, the instance isn't stored in its variable yet
+        label_variable_names()
+    _unlabeled[key] = namespace
+
+def label_variable_names():
+    """
+    Sets .variable_name on every Net and Part stored in a variable of the frames that created them.
+
+    This is done in a single pass, lazily (when some .variable_name is first read, by
+    :meth:`Context.autoname<pcbdl.Context.autoname>` or :func:`export<pcbdl.export>`), instead of every time
+    an instance is created. Afterwards the frames are let go.
+    """
+    pending = tuple(_unlabeled.items())
+    _unlabeled.clear()
+    for key, namespace in pending:
+        label_locals_with_variable_names(key.f_locals if namespace is None else namespace)
+
+class _LazyVariableName(object):
+    """Stands in for instance.variable_name, runs the pending label_variable_names() pass before looking."""
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        label_variable_names()
+        try:
+            return instance.__dict__["variable_name"]
+        except KeyError:
+            raise AttributeError("%r is not stored in any variable" % instance) from None
+
+for _cls in (Net, Part):
+    _cls.variable_name = _LazyVariableName()
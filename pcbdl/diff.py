@@ -0,0 +1,307 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Structural differences between two designs (for reviews and ECOs).
+"""
+
+from .context import Context
+from .allegro import ImportedNetlist, NetlistSyntaxError, read_netlist
+
+import collections
+import json
+import re
+
+__all__ = ["diff_netlists", "check_equivalence"]
+
+PartInfo = collections.namedtuple("PartInfo", "package part_number value")
+
+Change = collections.namedtuple("Change", "kind target old new")
+"""
+One difference between the designs. kind is one of:
+
+* ``"part_added"``, ``"part_removed"``: target is the refdes, old/new is {field: value}, with the nets of its
+  pins under ``"pins"`` ({pin number: net name}), they don't get a ``"pin_moved"`` of their own
+* ``"part_changed"``: target is the refdes, old and new are {field: value} of only the fields that changed
+* ``"net_added"``, ``"net_removed"``: target is the net name, old/new is the list of "REFDES.PIN"s
+* ``"net_renamed"``: target, old are the old net name, new is the new name
+* ``"pin_moved"``: target is "REFDES.PIN", old and new are the net names (None if not connected)
+"""
+
+class DesignIndex(object):
+    """
+    A design boiled down to what the netlist has, indexed for the diff:
+    ``parts`` is {refdes: :data:`PartInfo`}, ``nets`` is {name: frozenset of "REFDES.PIN"}
+    and ``pin_nets`` is {"REFDES.PIN": net name}. Everything keeps the order of the design.
+    """
+    def __init__(self):
+        self.parts = collections.OrderedDict()
+        self.nets = collections.OrderedDict()
+        self.pin_nets = {}
+
+    def _add_net(self, name, pins):
+        self.nets[name] = frozenset(pins)
+        for pin in pins:
+            self.pin_nets[pin] = name
+
+    @classmethod
+    def from_context(cls, context):
+        self = cls()
+        for part in context.parts_list:
+            self.parts[part.refdes] = PartInfo(getattr(part, "package", None), part.part_number, part.value)
+        for net in context.net_list:
+            self._add_net(net.name, ["%r.%s" % (pin.part, number) for pin in net.connections for number in pin.numbers])
+        return self
+
+    @classmethod
+    def from_netlist(cls, netlist):
+        self = cls()
+        for part in netlist.parts.values():
+            # same as Part(), no value means the part number is the value
+            value = part.value if part.value is not None else part.part_number
+            self.parts[part.refdes] = PartInfo(part.package, part.part_number, value)
+        for net in netlist.nets.values():
+            self._add_net(net.name, ["%s.%s" % pin for pin in net.pins])
+        return self
+
+def index(design):
+    """Makes a :class:`DesignIndex` out of a Context, an imported netlist, or a netlist filename."""
+    if isinstance(design, DesignIndex):
+        return design
+    if isinstance(design, Context):
+        return DesignIndex.from_context(design)
+    if not isinstance(design, ImportedNetlist):
+        design = read_netlist(design)
+    return DesignIndex.from_netlist(design)
+
+def _find_renames(old, new, removed_nets, added_nets):
+    """
+    {old name: new name} for removed nets that mostly live on in an added net.
+
+    A removed net is renamed to the added net that has most of its pins, if they share more
+    than half the pins of both of them.
+    """
+    renames = {}
+    taken = set()
+    for old_name in removed_nets:
+        old_pins = old.nets[old_name]
+        votes = collections.Counter(new.pin_nets.get(pin) for pin in old_pins)
+        for new_name, count in votes.most_common():
+            if new_name in added_nets:
+                break
+        else:
+            continue
+        if new_name in taken:
+            continue
+        if count * 2 > max(len(old_pins), len(new.nets[new_name])):
+            renames[old_name] = new_name
+            taken.add(new_name)
+    return renames
+
+def _part_pin_nets(design, refdeses):
+    """{refdes: {pin number: net name}} of only some of the parts."""
+    pins = collections.defaultdict(dict)
+    if refdeses:
+        for pin, name in design.pin_nets.items():
+            refdes, _, number = pin.partition(".")
+            if refdes in refdeses:
+                pins[refdes][number] = name
+    return pins
+
+def diff_netlists(old, new):
+    """
+    Structural differences going from the old design to the new one, as a list of :data:`Change`.
+
+    The designs can be Contexts, imported netlists or netlist filenames. Everything is looked up
+    by refdes, net name and pin, so it's linear in the size of the designs.
+    """
+    old, new = index(old), index(new)
+    changes = []
+
+    def with_pins(info, refdes, pins):
+        fields = info._asdict()
+        fields["pins"] = pins.get(refdes, {})
+        return fields
+
+    removed_parts = set(old.parts) - set(new.parts)
+    added_parts = set(new.parts) - set(old.parts)
+    removed_pins = _part_pin_nets(old, removed_parts)
+    added_pins = _part_pin_nets(new, added_parts)
+
+    for refdes, info in old.parts.items():
+        if refdes in removed_parts:
+            changes.append(Change("part_removed", refdes, with_pins(info, refdes, removed_pins), None))
+            continue
+        new_info = new.parts[refdes]
+        if info != new_info:
+            fields = [field for field in PartInfo._fields if getattr(info, field) != getattr(new_info, field)]
+            changes.append(Change("part_changed", refdes,
+                {field: getattr(info, field) for field in fields},
+                {field: getattr(new_info, field) for field in fields}))
+    for refdes, info in new.parts.items():
+        if refdes in added_parts:
+            changes.append(Change("part_added", refdes, None, with_pins(info, refdes, added_pins)))
+
+    removed_nets = [name for name in old.nets if name not in new.nets]
+    added_nets = collections.OrderedDict((name, None) for name in new.nets if name not in old.nets)
+    renames = _find_renames(old, new, removed_nets, added_nets)
+
+    for name in removed_nets:
+        if name in renames:
+            changes.append(Change("net_renamed", name, name, renames[name]))
+        else:
+            changes.append(Change("net_removed", name, sorted(old.nets[name]), None))
+    renamed_to = set(renames.values())
+    for name in added_nets:
+        if name not in renamed_to:
+            changes.append(Change("net_added", name, None, sorted(new.nets[name])))
+
+    # a pin only moved if it's on a different net than the renamed version of its old net
+    for pin, old_name in old.pin_nets.items():
+        if pin.partition(".")[0] in removed_parts:
+            continue
+        new_name = new.pin_nets.get(pin)
+        if renames.get(old_name, old_name) != new_name:
+            changes.append(Change("pin_moved", pin, old_name, new_name))
+    for pin, new_name in new.pin_nets.items():
+        if pin not in old.pin_nets and pin.partition(".")[0] not in added_parts:
+            changes.append(Change("pin_moved", pin, None, new_name))
+
+    return changes
+
+def changes_to_json(changes, **kwargs):
+    """The changes as a JSON list of {"kind", "target", "old", "new"} objects, for ECO tools."""
+    return json.dumps([change._asdict() for change in changes], **kwargs)
+
+ANONYMOUS_NET_RE = re.compile(r"ANON_NET|UNNAMED|N\d{5,}$")
+"""Net names that are just made up by the tools (pcbdl, google style, odm style), they're ignored by check_equivalence()."""
+
+INTERCHANGEABLE_PINS_RE = re.compile(r"([RLC]|FB)\d")
+"""Refdeses of jellybean parts, whose pin numbers don't matter."""
+
+Mismatch = collections.namedtuple("Mismatch", "side kind name neighbours")
+"""
+A part or net (kind ``"part"``/``"net"``) of design side ``"a"`` or ``"b"`` that doesn't have a match in the other design.
+neighbours is the sorted list of (pin number, net name) for parts, or (pin number, refdes) for nets.
+"""
+
+class Equivalence(object):
+    """Result of :func:`check_equivalence`, true if the circuits are the same."""
+    def __init__(self, differences, iterations):
+        self.differences = differences
+        self.iterations = iterations
+
+    @property
+    def equivalent(self):
+        return not self.differences
+
+    def __bool__(self):
+        return self.equivalent
+
+    def __repr__(self):
+        if self.equivalent:
+            return "Equivalence(equivalent)"
+        return "Equivalence(%d differences)" % len(self.differences)
+
+class _Graph(object):
+    """Bipartite part/net graph of a design, with edges labeled by pin number."""
+    def __init__(self, design, anonymous_net_re, interchangeable_pins_re, normalize_part_props):
+        design = index(design)
+        self.names = [] # [(kind, name)] by node number
+        self.edges = [] # [[(pin number, other node)]] by node number
+        labels = []
+
+        part_nodes = {}
+        for refdes, info in design.parts.items():
+            part_nodes[refdes] = len(self.names)
+            self.names.append(("part", refdes))
+            self.edges.append([])
+            label = ("part", re.match(r"[^\d]*", refdes).group(0), info.package)
+            if not normalize_part_props:
+                label += (info.part_number, info.value)
+            labels.append(label)
+
+        for name, pins in design.nets.items():
+            net_node = len(self.names)
+            self.names.append(("net", name))
+            self.edges.append([])
+            labels.append(("net", None if anonymous_net_re.match(name) else name))
+            for pin in pins:
+                refdes, _, number = pin.partition(".")
+                if interchangeable_pins_re.match(refdes):
+                    number = ""
+                try:
+                    part_node = part_nodes[refdes]
+                except KeyError:
+                    raise NetlistSyntaxError("net %s connects to %s, which is not in $PACKAGES" % (name, refdes)) from None
+                self.edges[part_node].append((number, net_node))
+                self.edges[net_node].append((number, part_node))
+
+        self.labels = labels
+
+    def neighbours(self, node):
+        return sorted((number, self.names[other][1]) for number, other in self.edges[node])
+
+def _recolor(graphs, signatures):
+    """Gives the same small number to the same signatures, across all the graphs."""
+    palette = {}
+    for graph, graph_signatures in zip(graphs, signatures):
+        graph.colors = [palette.setdefault(signature, len(palette)) for signature in graph_signatures]
+    return len(palette)
+
+def check_equivalence(a, b, anonymous_net_re=ANONYMOUS_NET_RE, interchangeable_pins_re=INTERCHANGEABLE_PINS_RE,
+                      normalize_part_props=False):
+    """
+    Checks if two designs (Contexts, imported netlists or netlist filenames) are the same circuit,
+    regardless of how their parts and anonymous nets are numbered.
+
+    Parts start out known only by their refdes prefix, package, part number and value (only the first two with
+    normalize_part_props=True, to only compare the connectivity), and nets by their name (unless it's anonymous).
+    Then, like the Weisfeiler-Lehman graph isomorphism test, every part and net is repeatedly renamed after itself
+    and its neighbours (and the pin numbers connecting them) until that doesn't tell them apart any more.
+    Each round is linear in the number of pins.
+
+    If at some round the designs don't have the same number of parts/nets with some name, the returned
+    :class:`Equivalence` lists (as :data:`Mismatch`) the ones that don't have a counterpart.
+
+    Raises NetlistSyntaxError if a net connects to a part that's not in the design.
+    """
+    graphs = (_Graph(a, anonymous_net_re, interchangeable_pins_re, normalize_part_props),
+              _Graph(b, anonymous_net_re, interchangeable_pins_re, normalize_part_props))
+    color_count = _recolor(graphs, [graph.labels for graph in graphs])
+
+    iteration = 0
+    while True:
+        counts = [collections.Counter(graph.colors) for graph in graphs]
+        if counts[0] != counts[1]:
+            break
+
+        iteration += 1
+        signatures = [[
+            (color, tuple(sorted((number, graph.colors[other]) for number, other in edges)))
+            for color, edges in zip(graph.colors, graph.edges)
+        ] for graph in graphs]
+        new_color_count = _recolor(graphs, signatures)
+        if new_color_count == color_count:
+            # stable, nothing else to learn
+            return Equivalence([], iteration)
+        color_count = new_color_count
+
+    differences = []
+    for side, graph, mine, theirs in (("a", graphs[0], counts[0], counts[1]), ("b", graphs[1], counts[1], counts[0])):
+        for node, color in enumerate(graph.colors):
+            if mine[color] > theirs[color]:
+                kind, name = graph.names[node]
+                differences.append(Mismatch(side, kind, name, graph.neighbours(node)))
+    return Equivalence(differences, iteration)
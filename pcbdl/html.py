@@ -54,8 +54,8 @@ class HTMLPart(Plugin):
         l = self.instance.__class__.__mro__
         l = l[:l.index(Part) + 1]
         for cls in l:
-            filename, line = inspect.getsourcelines(cls)
-            filename = os.path.relpath(inspect.getsourcefile(cls), pcbdl.defined_at.cwd)
+            filename, line = pcbdl.defined_at.class_location(cls)
+            filename = os.path.relpath(filename, pcbdl.defined_at.cwd)
             if filename in self.code_manager.file_database:
                 yield "<a href=\"#%s-%d\">%s</a>" % (filename, line, html.escape(repr(cls)))
             else:
@@ -217,8 +217,7 @@ class Code:
         for filename in file_list:
             yield "<h2 id=\"%s\">%s</h2>" % (filename, filename)
 
-            with open(filename) as f:
-                source_code = f.read()
+            source_code = pcbdl.defined_at.source_cache.text(filename)
 
             self.formatter.set_source_file(filename, self.file_database[filename])
             result = pygments.highlight(source_code, self.lexer, self.formatter)
@@ -259,7 +258,11 @@ class Code:
             yield result
 
 
-def html_generator(context=global_context, include_svg=False):
+def html_generator(context=None, include_svg=False):
+    pcbdl.defined_at.require_source_tracking("HTML output")
+    if context is None:
+        context = current_context()
+
     code_manager = Code()
 
     HTMLDefinedAt.code_manager = code_manager
@@ -274,8 +277,8 @@ def html_generator(context=global_context, include_svg=False):
         for cls in l:
             filename = inspect.getsourcefile(cls)
             if _PCBDL_BUILTINS_PATH not in filename: # we don't want pcbdl builtin files in the list
+                filename, line = pcbdl.defined_at.class_location(cls)
                 filename = os.path.relpath(filename, pcbdl.defined_at.cwd)
-                _, line = inspect.getsourcelines(cls)
                 code_manager.instanced_here(part, filename, line)
 
     yield "<!DOCTYPE html>"
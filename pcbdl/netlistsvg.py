@@ -14,35 +14,351 @@
 
 from .base import Part, PartInstancePin, Net
 from .context import *
+from .partition import partition_parts
 import pcbdl.small_parts as small_parts
 
+import codecs
 import collections
+import concurrent.futures
+import hashlib
+import io
+import itertools
 import json
+import logging
 import os
+import queue
 import re
 import subprocess
 import tempfile
+import threading
 
 """Renders our circuit into svg with the help of netlistsvg."""
-__all__ = ["generate_svg", "SVGPage"]
+__all__ = ["generate_svg", "generate_svg_views", "SVGPage", "NetlistsvgWorker", "NetlistsvgPool", "NetlistsvgCache"]
+
+logger = logging.getLogger(__name__)
 
 NETLISTSVG_LOCATION = os.path.expanduser(
     os.environ.get("NETLISTSVG_LOCATION", "~/netlistsvg"))
 
+NETLISTSVG_CACHE_LOCATION = os.path.expanduser(
+    os.environ.get("NETLISTSVG_CACHE_LOCATION",
+        os.path.join(os.environ.get("XDG_CACHE_HOME", "~/.cache"), "pcbdl", "netlistsvg")))
+
 NET_REGEX_ALL = ".*"
 
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "netlistsvg_worker.js")
+
+def netlistsvg_skin_file():
+    return os.path.join(NETLISTSVG_LOCATION, "lib", "analog.svg")
+
+class NetlistsvgError(Exception):
+    pass
+
+# When a net appears in a few places (when we have airwires), we need to disambiguage the parts of the net
+# so netlistsvg doesn't think they're actually the same net and should connect them together.
+# The renderers remove the extra decoration from the svg as it comes out of netlistsvg.
+_NODE_SUFFIX_RE = re.compile(r"_node\d+")
+_PARTIAL_NODE_SUFFIX_RE = re.compile(r"_(n(o(d(e\d*)?)?)?)?$") # might continue in the next chunk
+
+def strip_node_suffixes(chunks):
+    """Yields the chunks of svg text without the ``_node<number>`` decorations, even if they're split between chunks."""
+    pending = ""
+    for chunk in chunks:
+        text = pending + chunk
+        partial = _PARTIAL_NODE_SUFFIX_RE.search(text)
+        cut = partial.start() if partial else len(text)
+        pending = text[cut:]
+        yield _NODE_SUFFIX_RE.sub("", text[:cut])
+    yield _NODE_SUFFIX_RE.sub("", pending)
+
+_CHUNK_SIZE = 64 * 1024
+
+def _read_svg(f, length=None):
+    """Reads svg (all of it, or length bytes) from the binary pipe f, see :func:`strip_node_suffixes`."""
+    decoder = codecs.getincrementaldecoder("utf8")()
+    left = length
+    def chunks():
+        nonlocal left
+        while left is None or left > 0:
+            data = f.read(_CHUNK_SIZE if left is None else min(_CHUNK_SIZE, left))
+            if not data:
+                break
+            if left is not None:
+                left -= len(data)
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+
+    svg_contents = "".join(strip_node_suffixes(chunks()))
+    if left:
+        raise BrokenPipeError("svg cut short")
+    return svg_contents
+
+class NetlistsvgProcess(object):
+    """
+    Renders every page with a fresh netlistsvg process, the json is piped in and the svg piped out.
+
+    Renderers take the netlistsvg input json (as a string) and return the svg contents,
+    without the ``_node<number>`` decorations of the nets.
+    """
+    def render(self, netlist_json):
+        netlistsvg_command = [
+            "/usr/bin/env", "node", WORKER_SCRIPT, "--single",
+            NETLISTSVG_LOCATION,
+            netlistsvg_skin_file(),
+        ]
+        logger.debug("Running %s", netlistsvg_command)
+        with subprocess.Popen(netlistsvg_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+            try:
+                process.stdin.write(netlist_json.encode("utf8"))
+                process.stdin.close()
+            except BrokenPipeError:
+                pass # it will tell us why
+            svg_contents = _read_svg(process.stdout)
+        if process.returncode:
+            raise NetlistsvgError("netlistsvg failed (exit code %d)" % process.returncode)
+        return svg_contents
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class NetlistsvgWorker(NetlistsvgProcess):
+    """
+    Keeps a single node process around (running netlistsvg_worker.js) that has netlistsvg, the layout engine
+    and the skin already loaded, pages are sent to it through a pipe. Use it as the renderer for
+    :func:`generate_svg` (or :meth:`SVGPage.generate`), and close() it (or use it in a with block) when done::
+
+        with NetlistsvgWorker() as worker:
+            pages = list(generate_svg(renderer=worker))
+
+    If the process dies it's started again, and the page it was working on is retried once.
+    After max_restarts restarts :class:`NetlistsvgError` is raised, like for errors reported by netlistsvg itself.
+
+    command can replace the node process with anything that talks the same protocol (see netlistsvg_worker.js).
+    """
+    def __init__(self, command=None, max_restarts=3):
+        self.command = command
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.process = None
+        self.lock = threading.Lock() # one page at a time
+
+    def _start(self):
+        command = self.command
+        if command is None:
+            command = ["/usr/bin/env", "node", WORKER_SCRIPT, NETLISTSVG_LOCATION, netlistsvg_skin_file()]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            for f in (self.process.stdin, self.process.stdout):
+                f.close()
+            self.process = None
+
+    def _exchange(self, request):
+        process = self.process
+        process.stdin.write(b"%d\n" % len(request))
+        process.stdin.write(request)
+        process.stdin.flush()
+
+        header = process.stdout.readline()
+        if not header.endswith(b"\n"):
+            raise BrokenPipeError("netlistsvg worker quit")
+        status, length = header.split()
+        length = int(length)
+        if status != b"ok":
+            return status, process.stdout.read(length).decode("utf8", "replace")
+        return status, _read_svg(process.stdout, length)
+
+    def render(self, netlist_json):
+        with self.lock:
+            return self._render(netlist_json.encode("utf8"))
+
+    def _render(self, request):
+        for attempt in range(2):
+            if self.process is None:
+                self._start()
+            try:
+                status, response = self._exchange(request)
+                break
+            except (BrokenPipeError, ValueError) as e:
+                # it crashed, or it's saying nonsense
+                self._kill()
+                self.restarts += 1
+                if attempt or self.restarts > self.max_restarts:
+                    raise NetlistsvgError("netlistsvg worker died (restarted %d times)" % self.restarts) from e
+
+        if status != b"ok":
+            raise NetlistsvgError(response)
+        return response
+
+    def close(self):
+        """Stops the node process."""
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            pass
+        self._kill()
+
+class NetlistsvgPool(NetlistsvgProcess):
+    """
+    Up to processes (by default the number of cpus) :class:`NetlistsvgWorker` started as needed,
+    so multiple threads can render at the same time. The worker arguments are passed along.
+    """
+    def __init__(self, processes=None, **worker_kwargs):
+        self.processes = processes or os.cpu_count() or 1
+        self.worker_kwargs = worker_kwargs
+        self.workers = []
+        self.idle_workers = queue.Queue()
+        self.lock = threading.Lock()
+
+    def _get_worker(self):
+        try:
+            return self.idle_workers.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.workers) < self.processes:
+                worker = NetlistsvgWorker(**self.worker_kwargs)
+                self.workers.append(worker)
+                return worker
+        return self.idle_workers.get()
+
+    def render(self, netlist_json):
+        worker = self._get_worker()
+        try:
+            return worker.render(netlist_json)
+        finally:
+            self.idle_workers.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+        self.idle_workers = queue.Queue()
+
+def netlistsvg_version():
+    try:
+        with open(os.path.join(NETLISTSVG_LOCATION, "package.json")) as f:
+            return str(json.load(f).get("version"))
+    except (OSError, ValueError):
+        return None
+
+class NetlistsvgCache(NetlistsvgProcess):
+    """
+    Keeps rendered pages on disk, so pages that didn't change since the last run don't need netlistsvg at all.
+
+    Pages are found by a hash of their json, the skin and the version of netlistsvg. When the cache gets bigger than
+    max_size bytes, the least recently used pages are removed. Pages that aren't in the cache are rendered with
+    renderer (by default :class:`NetlistsvgProcess`, it's only started if needed)::
+
+        with NetlistsvgCache(NetlistsvgWorker()) as renderer:
+            pages = list(generate_svg(renderer=renderer))
+    """
+    def __init__(self, renderer=None, location=None, max_size=64 * 1024 * 1024):
+        if renderer is None:
+            renderer = NetlistsvgProcess()
+        self.renderer = renderer
+        self.location = location or NETLISTSVG_CACHE_LOCATION
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._salt = None
+        self._entries = None
+
+    def _load(self):
+        """{filename: size} of what's in the cache, least recently used first."""
+        os.makedirs(self.location, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.location):
+            if entry.name.endswith(".svg") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._entries = collections.OrderedDict((name, size) for _, name, size in entries)
+        self._size = sum(self._entries.values())
+
+    def key(self, netlist_json):
+        if self._salt is None:
+            salt = hashlib.sha256()
+            salt.update(repr(netlistsvg_version()).encode("utf8"))
+            with open(netlistsvg_skin_file(), "rb") as f:
+                salt.update(hashlib.sha256(f.read()).digest())
+            self._salt = salt
+        key = self._salt.copy()
+        key.update(netlist_json.encode("utf8"))
+        return key.hexdigest()
+
+    def render(self, netlist_json):
+        filename = self.key(netlist_json) + ".svg"
+        path = os.path.join(self.location, filename)
+
+        with self.lock:
+            if self._entries is None:
+                self._load()
+            if filename in self._entries:
+                try:
+                    with open(path, encoding="utf8") as f:
+                        svg_contents = f.read()
+                except FileNotFoundError:
+                    self._size -= self._entries.pop(filename) # someone else cleaned it up
+                else:
+                    os.utime(path)
+                    self._entries.move_to_end(filename)
+                    self.hits += 1
+                    return svg_contents
+            self.misses += 1
+
+        svg_contents = self.renderer.render(netlist_json)
+
+        with self.lock:
+            with tempfile.NamedTemporaryFile("w", encoding="utf8", dir=self.location, suffix=".tmp", delete=False) as f:
+                f.write(svg_contents)
+            os.replace(f.name, path)
+            self._size -= self._entries.pop(filename, 0)
+            self._entries[filename] = os.path.getsize(path)
+            self._size += self._entries[filename]
+            self._evict()
+
+        return svg_contents
+
+    def _evict(self):
+        while self._size > self.max_size and len(self._entries) > 1:
+            filename, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(os.path.join(self.location, filename))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.renderer.close()
+
 class SVGNet(object):
     def __init__(self, instance, schematic_page):
         self.instance = instance
         self.schematic_page = schematic_page
 
-    current_node_number = -1
-    @classmethod
-    def get_next_node_number(cls):
-        cls.current_node_number += 1
-        return cls.current_node_number
-
     def categorize_groups(self):
+        split_big_parts = self.schematic_page.airwires >= 2
+        key = (self.instance, split_big_parts)
+        try:
+            self.grouped_connections, self.pin_groups = self.schematic_page.net_groups[key]
+            return
+        except KeyError:
+            pass
+
         self.grouped_connections = []
 
         for original_group in self.instance.grouped_connections:
@@ -50,12 +366,13 @@ class SVGNet(object):
             group_pin_count = sum(len(pin.part.pins) for pin in group)
             self.grouped_connections.append(group)
 
-            if self.schematic_page.airwires < 2:
+            if not split_big_parts:
                 continue
 
             #if group_pin_count < 40:
                 #continue
 
+            moved_out = []
             first_big_part = None
             for pin in original_group:
                 if len(pin.part.pins) <= 3:
@@ -69,22 +386,28 @@ class SVGNet(object):
                 if pin.part is not first_big_part:
                     # too many big parts here, move this one out
                     #print("Too many big parts in %s group %r, moving %r out" % (self.instance.name, group, pin))
-                    group.remove(pin)
-                    self.grouped_connections.append((pin,))
+                    moved_out.append(pin)
+
+            if moved_out:
+                moved_out_set = set(moved_out)
+                group[:] = [pin for pin in group if pin not in moved_out_set]
+                self.grouped_connections.extend((pin,) for pin in moved_out)
 
+        self.pin_groups = {pin: i
+            for i, group in enumerate(self.grouped_connections)
+            for pin in group}
 
-        self.node_numbers = [self.get_next_node_number()
-            for group in self.grouped_connections]
+        self.schematic_page.net_groups[key] = (self.grouped_connections, self.pin_groups)
 
     def _find_group(self, pin):
-        if not hasattr(self, "node_numbers"):
+        if not hasattr(self, "pin_groups"):
             self.categorize_groups()
 
-        for i, group in enumerate(self.grouped_connections):
-            if pin in group:
-                return i, group
-
-        raise ValueError("Can't find pin %s on %s" % (pin, self.instance))
+        try:
+            i = self.pin_groups[pin]
+        except KeyError:
+            raise ValueError("Can't find pin %s on %s" % (pin, self.instance)) from None
+        return i, self.grouped_connections[i]
 
     def get_other_pins_in_group(self, pin):
         _, group = self._find_group(pin)
@@ -94,8 +417,8 @@ class SVGNet(object):
         group_idx, _ = self._find_group(pin)
 
         if self.schematic_page.airwires == 0:
-            return self.node_numbers[0]
-        return self.node_numbers[group_idx]
+            group_idx = 0
+        return self.schematic_page.get_node_number((self, group_idx))
 
 class SVGPart(object):
     SKIN_MAPPING = { # pcbdl_class: (skin_alias_name, pin_names, is_symmetric, is_rotatable)
@@ -107,6 +430,20 @@ class SVGPart(object):
         small_parts.D:   ("d_", "+-", False, True),
     }
     SKIN_MAPPING_INSTANCES = tuple(SKIN_MAPPING.keys())
+    _skin_cache = {} # {part class: SKIN_MAPPING entry or None}
+
+    @classmethod
+    def skin_properties(cls, part_class):
+        """The SKIN_MAPPING entry of the closest class in the part's class hierarchy (None if there's none)."""
+        try:
+            return cls._skin_cache[part_class]
+        except KeyError:
+            pass
+        skin_properties = next((cls.SKIN_MAPPING[base] for base in part_class.__mro__ if base in cls.SKIN_MAPPING), None)
+        cls._skin_cache[part_class] = skin_properties
+        return skin_properties
+
+    MAX_TRACE_INDENT = 40 # long chains of parts would log a lot of spaces
 
     def __init__(self, part, schematic_page):
         self.part = part
@@ -118,11 +455,13 @@ class SVGPart(object):
         self.is_symmetric = False
         self.is_rotatable = False
 
-        for possible_class, skin_properties in self.SKIN_MAPPING.items():
-            if isinstance(part, possible_class):
-                self.is_skinned = True
-                self.svg_type, self.skin_pin_names, self.is_symmetric, self.is_rotatable = skin_properties
-                break
+        skin_properties = self.skin_properties(type(part))
+        if skin_properties is not None:
+            self.is_skinned = True
+            self.svg_type, self.skin_pin_names, self.is_symmetric, self.is_rotatable = skin_properties
+
+        # if any pin is good on a small part, we should draw the whole part (all pins)
+        self.draw_all_pins = self.is_skinned or part.refdes.startswith("Q")
 
     def attach_net_name_port(self, net, net_node_number, direction):
         self.schematic_page.ports_dict["%s_node%s" % (net.name, str(net_node_number))] = {
@@ -161,12 +500,43 @@ class SVGPart(object):
             # if we don't have a pin name, do it conditionally based on if a regex is set
             return self.schematic_page.net_regex.pattern == NET_REGEX_ALL
         else:
-            return self.schematic_page.net_regex.match(str(pin.net.name))
+            return self.schematic_page.net_matches(pin.net)
+
+    def pins_to_draw(self):
+        """should_draw_pin() of every pin, or all True if any of them is on parts that are drawn whole."""
+        to_draw = [self.should_draw_pin(pin) for pin in self.part.pins]
+        if self.draw_all_pins and any(to_draw):
+            return [True] * len(to_draw)
+        return to_draw
+
+    def drawable_pin_count(self):
+        """How many pins draw() would draw."""
+        return sum(self.pins_to_draw())
+
+    def add_parts(self):
+        """
+        Draws this part, then the parts connected to it (depth first) that aren't drawn yet, so they're squeezed
+        on the same page. It's a worklist (of iterators over each drawn part's neighbours) instead of recursion,
+        long chains of parts would go over the recursion limit.
+        """
+        page = self.schematic_page
+        worklist = [iter((self.part,))]
+        while worklist:
+            for other_part in worklist[-1]:
+                if other_part not in page.parts_to_draw:
+                    # we already drew it earlier
+                    continue
+                neighbours = page.part_helpers[other_part].draw(len(worklist) - 1)
+                worklist.append(iter(neighbours))
+                break
+            else:
+                worklist.pop()
 
-    def add_parts(self, indent_depth=""):
+    def draw(self, depth=0):
+        """Draws just this part, returns the parts connected to it."""
         # Every real part might yield multiple smaller parts (eg: airwires, gnd/vcc connections)
         part = self.part
-        self.schematic_page.parts_to_draw.remove(part)
+        del self.schematic_page.parts_to_draw[part]
 
         connections = {}
         port_directions = {}
@@ -174,6 +544,7 @@ class SVGPart(object):
         parts_to_bring_on_page = []
 
         pin_count = len(part.pins)
+        pins_to_draw = self.pins_to_draw()
         for i, pin in enumerate(part.pins):
             name = "%s (%s)" % (pin.name, ", ".join(pin.numbers))
             if self.skin_pin_names:
@@ -215,15 +586,9 @@ class SVGPart(object):
                     parts_to_bring_on_page.append(other_part)
             else:
                 # Make up a new disposable connection
-                connections[name] = [SVGNet.get_next_node_number()]
+                connections[name] = [self.schematic_page.get_next_node_number()]
 
-            skip_drawing_pin = not self.should_draw_pin(pin)
-
-            if self.is_skinned or part.refdes.startswith("Q"):
-                # if any other pins good on a small part, we should draw the whole part (all pins)
-                for other_pin in set(part.pins) - set((pin,)):
-                    if self.should_draw_pin(other_pin):
-                        skip_drawing_pin = False
+            skip_drawing_pin = not pins_to_draw[i]
 
             if pin in self.schematic_page.pins_to_skip:
                 skip_drawing_pin = True
@@ -232,7 +597,7 @@ class SVGPart(object):
                 del connections[name]
                 continue
 
-            self.schematic_page.pins_drawn.append(pin)
+            self.schematic_page.pins_drawn.add(pin)
             self.schematic_page.pin_count += 1
 
             if pin_net:
@@ -243,8 +608,9 @@ class SVGPart(object):
                 self.attach_net_name(pin.net, net_node_number, display=display_net_name)
 
         if not connections:
-            return
+            return ()
 
+        svg_type = self.svg_type
         if self.is_rotatable:
             suffix = "h"
             swap_pins = False
@@ -265,44 +631,38 @@ class SVGPart(object):
                     for name, v in connections.items()}
 
             if self.is_rotatable:
-                self.svg_type += suffix
+                svg_type += suffix
 
         self.schematic_page.cells_dict[self.part.refdes] = {
             "connections": connections,
             "port_directions": port_directions,
             "attributes": {"value": part.value},
-            "type": self.svg_type
+            "type": svg_type
         }
 
-        print(indent_depth + str(part))
+        logger.debug("%s%s", " " * min(depth, self.MAX_TRACE_INDENT), part)
 
-        # Make sure the other related parts are squeezed on this page
-        for other_part in parts_to_bring_on_page:
-            if other_part not in self.schematic_page.parts_to_draw:
-                # we already drew it earlier
-                continue
-
-            self.schematic_page.part_helpers[other_part].add_parts(indent_depth + " ")
+        return parts_to_bring_on_page
 
 class SVGPage(object):
     """Represents single .svg page"""
 
-    def __init__(self, net_regex=NET_REGEX_ALL, airwires=2, pins_to_skip=[], max_pin_count=None, context=global_context):
+    def __init__(self, net_regex=NET_REGEX_ALL, airwires=2, pins_to_skip=[], max_pin_count=None, context=None,
+                 net_groups=None):
         self.net_regex = re.compile(net_regex)
         self.airwires = airwires
-        self.context = context
+        self.context = current_context() if context is None else context
+
+        # {(net, split big parts): (grouped connections, {pin: group index})}, can be shared between pages
+        # of the same design (see generate_svg_views)
+        self.net_groups = {} if net_groups is None else net_groups
 
         self.max_pin_count = max_pin_count
         self.pin_count = 0
 
-        self.pins_to_skip = pins_to_skip
-        self.pins_drawn = []
-
-        self.cells_dict = {}
-        self.netnames_dict = collections.defaultdict(lambda: {"bits": [], "hide_name": 1})
-        self.ports_dict = {}
+        self.pins_to_skip = set(pins_to_skip)
 
-        # start helper classes
+        # start helper classes, they're kept for all the following pages
         self.net_helpers = {}
         for net in self.context.net_list:
             self.net_helpers[net] = SVGNet(net, self)
@@ -311,19 +671,80 @@ class SVGPage(object):
         for part in self.context.parts_list:
             self.part_helpers[part] = SVGPart(part, self)
 
+        # parts that might still have something to draw
+        self.parts_left = dict.fromkeys(self.context.parts_list)
+
+        self._net_matches = {} # {net: bool}, the regex is the same for all the pages
+
+        self._start_page()
+
+    def _start_page(self):
+        self.pin_count = 0
+        self.pins_drawn = set()
+
+        # numbered in drawing order, so the json of a page only depends on what's on it
+        self.node_numbers = {} # {(net helper, group index): node number}
+        self.current_node_number = -1
+
+        self.cells_dict = {}
+        self.netnames_dict = collections.defaultdict(lambda: {"bits": [], "hide_name": 1})
+        self.ports_dict = {}
+
+    def next_page(self):
+        """
+        Moves on to the next page: what was drawn so far gets skipped, the rest of the design
+        can be drawn with :meth:`write_json` again.
+        """
+        self.pins_to_skip |= self.pins_drawn
+        self.parts_left = {part: None for part in self.parts_left
+            if not self.pins_to_skip.issuperset(part.pins)}
+        self._start_page()
+
+    def net_matches(self, net):
+        """If the net name matches net_regex."""
+        try:
+            return self._net_matches[net]
+        except KeyError:
+            matches = self._net_matches[net] = bool(self.net_regex.match(str(net.name)))
+            return matches
+
+    def partition(self):
+        """
+        The parts left to draw split in pages of about max_pin_count (drawn) pins each, cutting as few
+        nets as possible, see :func:`partition_parts<pcbdl.partition.partition_parts>`.
+        """
+        pin_counts = {part: self.part_helpers[part].drawable_pin_count() for part in self.parts_left}
+        return partition_parts([part for part, count in pin_counts.items() if count],
+            self.max_pin_count, pin_counts.__getitem__)
+
+    def get_next_node_number(self):
+        self.current_node_number += 1
+        return self.current_node_number
+
+    def get_node_number(self, key):
+        try:
+            return self.node_numbers[key]
+        except KeyError:
+            node_number = self.node_numbers[key] = self.get_next_node_number()
+            return node_number
+
     class PageEmpty(Exception):
         pass
 
-    def write_json(self, fp):
-        """Generate the json input required for netlistsvg and dumps it to a file."""
-        self.parts_to_draw = collections.deque(self.context.parts_list)
+    def write_json(self, fp, whole=False):
+        """
+        Generate the json input required for netlistsvg and dumps it to a file.
+
+        With whole=True all the parts left are drawn, even past max_pin_count (they were already split in pages).
+        """
+        self.parts_to_draw = dict(self.parts_left) # ordered set
         while self.parts_to_draw:
 
-            if self.max_pin_count and self.pin_count > self.max_pin_count:
+            if not whole and self.max_pin_count and self.pin_count > self.max_pin_count:
                 # stop drawing, this page is too cluttered
                 break
 
-            part = self.parts_to_draw[0]
+            part = next(iter(self.parts_to_draw))
             self.part_helpers[part].add_parts()
 
         if not self.pins_drawn:
@@ -338,44 +759,111 @@ class SVGPage(object):
         json.dump(big_dict, fp, indent=4)
         fp.flush()
 
-    def generate(self):
-        """Calls netlistsvg to generate the page and returns the svg contents as a string."""
-        with tempfile.NamedTemporaryFile("w", prefix="netlistsvg_input_", suffix=".json", delete=False) as json_file, \
-             tempfile.NamedTemporaryFile("r", prefix="netlistsvg_output_", suffix=".svg", delete=False) as netlistsvg_output:
-            self.write_json(json_file)
-            netlistsvg_command = [
-                "/usr/bin/env", "node",
-                os.path.join(NETLISTSVG_LOCATION, "bin", "netlistsvg.js"),
-
-                "--skin",
-                os.path.join(NETLISTSVG_LOCATION, "lib", "analog.svg"),
-
-                json_file.name,
-
-                "-o",
-                netlistsvg_output.name
-            ]
-            print(netlistsvg_command)
-            subprocess.call(netlistsvg_command)
-
-            svg_contents = netlistsvg_output.read()
-
-        # When a net appears in a few places (when we have airwires), we need to disambiguage the parts of the net
-        # so netlistsvg doesn't think they're actually the same net and should connect them together.
-        # Remove the extra decoration:
-        svg_contents = re.sub("_node\d+", "", svg_contents)
-
-        return svg_contents
-
-
-def generate_svg(*args, **kwargs):
-    pins_to_skip = []
-    while True:
-        n = SVGPage(*args, **kwargs, pins_to_skip=pins_to_skip)
-        try:
-            svg_contents = n.generate()
-        except SVGPage.PageEmpty:
-            break
-        pins_to_skip += n.pins_drawn
-
-        yield svg_contents
+    def json(self, whole=False):
+        """The json input for netlistsvg as a string, see :meth:`write_json`."""
+        json_file = io.StringIO()
+        self.write_json(json_file, whole)
+        return json_file.getvalue()
+
+    def generate(self, renderer=None):
+        """
+        Calls netlistsvg to generate the page and returns the svg contents as a string.
+
+        renderer is what runs netlistsvg, by default a new process for this page, see :class:`NetlistsvgWorker`.
+        """
+        if renderer is None:
+            renderer = NetlistsvgProcess()
+        return renderer.render(self.json())
+
+
+def _layout_pages(page, partition=False):
+    """The json of every page of the design, see :func:`generate_svg`."""
+    page_jsons = []
+    if partition and page.max_pin_count:
+        for page_parts in page.partition():
+            page.parts_left = dict.fromkeys(page_parts)
+            try:
+                page_jsons.append(page.json(whole=True))
+            except SVGPage.PageEmpty:
+                pass
+            page.next_page()
+    else:
+        while True:
+            try:
+                page_jsons.append(page.json())
+            except SVGPage.PageEmpty:
+                break
+            page.next_page()
+    return page_jsons
+
+def _render_pages(page_jsons, renderer, processes=None):
+    """Yields the svg of every page json (in order), rendering processes of them at the same time."""
+    if processes is None or processes <= 1:
+        for page_json in page_jsons:
+            yield renderer.render(page_json)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(processes) as executor:
+        yield from executor.map(renderer.render, page_jsons)
+
+def generate_svg(*args, renderer=None, processes=None, partition=False, **kwargs):
+    """
+    Yields the svg contents of every page needed to draw the design, the arguments are the same as :class:`SVGPage`.
+
+    By default parts are drawn (in order, pulling in the parts they're connected to) until a page has max_pin_count
+    pins. With partition=True the parts are first split in balanced pages that cut as few nets as possible
+    (see :meth:`SVGPage.partition`), so each page takes about the same time to lay out.
+
+    All the pages are laid out first, then rendered by netlistsvg. With processes > 1 that many pages are rendered
+    at the same time (by a :class:`NetlistsvgPool` unless a renderer is given), they still come out in order.
+    """
+    page_jsons = _layout_pages(SVGPage(*args, **kwargs), partition)
+
+    if processes is None or processes <= 1:
+        if renderer is None:
+            renderer = NetlistsvgProcess()
+        yield from _render_pages(page_jsons, renderer)
+        return
+
+    own_renderer = renderer is None
+    if own_renderer:
+        renderer = NetlistsvgPool(processes)
+    try:
+        yield from _render_pages(page_jsons, renderer, processes)
+    finally:
+        if own_renderer:
+            renderer.close()
+
+def generate_svg_views(views, context=None, renderer=None, processes=None):
+    """
+    Draws several views of the same design in one go. views is {name: :func:`generate_svg` arguments}, eg::
+
+        generate_svg_views({
+            "all": {},
+            "i2c": {"net_regex": ".*(SDA|SCL).*", "airwires": 0},
+            "power": {"net_regex": ".*(PP|GND|VIN|VBUS).*"},
+        })
+
+    Returns {name: [svg contents of every page]}. The views share the net group categorizations and all their
+    pages go through the same renderer: by default a single :class:`NetlistsvgWorker`, or a
+    :class:`NetlistsvgPool` with processes > 1.
+    """
+    net_groups = {}
+    view_jsons = collections.OrderedDict()
+    for name, view in views.items():
+        view = dict(view)
+        partition = view.pop("partition", False)
+        page = SVGPage(context=context, net_groups=net_groups, **view)
+        view_jsons[name] = _layout_pages(page, partition)
+
+    own_renderer = renderer is None
+    if own_renderer:
+        renderer = NetlistsvgPool(processes) if processes is not None and processes > 1 else NetlistsvgWorker()
+    try:
+        svgs = _render_pages([page_json for page_jsons in view_jsons.values() for page_json in page_jsons],
+                             renderer, processes)
+        return collections.OrderedDict((name, list(itertools.islice(svgs, len(page_jsons))))
+                                       for name, page_jsons in view_jsons.items())
+    finally:
+        if own_renderer:
+            renderer.close()
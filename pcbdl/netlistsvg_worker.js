@@ -0,0 +1,99 @@
+#!/usr/bin/env node
+
+// Copyright 2020 Google LLC
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     https://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Keeps netlistsvg (with the layout engine and the skin) loaded and renders pages as they come on stdin.
+// See NetlistsvgWorker in netlistsvg.py.
+//
+// Usage: netlistsvg_worker.js [--single] <netlistsvg location> <skin file>
+//
+// Every request is "<byte count>\n<netlist json>",
+// every answer is "ok <byte count>\n<svg>" or "error <byte count>\n<message>", in the same order.
+//
+// With --single it's just one netlist json on stdin, and the svg on stdout (see NetlistsvgProcess).
+
+"use strict";
+
+const fs = require("fs");
+const path = require("path");
+
+const args = process.argv.slice(2);
+const single = args[0] === "--single";
+if (single) {
+  args.shift();
+}
+const [netlistsvgLocation, skinFile] = args;
+const netlistsvg = require(path.resolve(netlistsvgLocation));
+const skin = fs.readFileSync(skinFile, "utf8");
+
+function render(netlist) {
+  return new Promise((resolve, reject) => {
+    const done = (err, svg) => (err ? reject(err) : resolve(svg));
+    const result = netlistsvg.render(skin, netlist, done);
+    if (result && result.then) {
+      result.then(resolve, reject);
+    }
+  });
+}
+
+function reply(status, text) {
+  const data = Buffer.from(String(text), "utf8");
+  process.stdout.write(status + " " + data.length + "\n");
+  process.stdout.write(data);
+}
+
+function renderSingle() {
+  const chunks = [];
+  process.stdin.on("data", (chunk) => chunks.push(chunk));
+  process.stdin.on("end", () => {
+    render(JSON.parse(Buffer.concat(chunks).toString("utf8"))).then(
+      (svg) => process.stdout.write(svg),
+      (err) => {
+        console.error((err && err.stack) || err);
+        process.exitCode = 1;
+      });
+  });
+}
+
+let buffer = Buffer.alloc(0);
+let queue = Promise.resolve();
+
+function onData(chunk) {
+  buffer = Buffer.concat([buffer, chunk]);
+  for (;;) {
+    const newline = buffer.indexOf(10);
+    if (newline < 0) {
+      return;
+    }
+    const length = parseInt(buffer.toString("ascii", 0, newline), 10);
+    const end = newline + 1 + length;
+    if (buffer.length < end) {
+      return;
+    }
+    const request = buffer.toString("utf8", newline + 1, end);
+    buffer = buffer.subarray(end);
+
+    queue = queue
+      .then(() => render(JSON.parse(request)))
+      .then((svg) => reply("ok", svg), (err) => reply("error", (err && err.stack) || err));
+  }
+}
+
+if (single) {
+  renderSingle();
+} else {
+  process.stdin.on("data", onData);
+  process.stdin.on("end", () => queue.then(() => process.exit(0)));
+}
@@ -0,0 +1,339 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Splits the parts of a design in balanced groups (eg: schematic pages), cutting as few nets as possible.
+"""
+
+import collections
+import heapq
+import math
+
+__all__ = ["partition_parts"]
+
+def _pin_count(part):
+    return len(part.pins)
+
+def _part_nets(parts):
+    """[[part index]] of every net connecting at least 2 of the parts, except power and ground nets."""
+    nets = collections.OrderedDict()
+    for i, part in enumerate(parts):
+        for pin in part.pins:
+            net = pin._net
+            if net is None:
+                continue
+            net = getattr(net, "parent", net)
+            if net.is_power or net.is_gnd:
+                # they're on every page anyway (as power symbols), cutting them is free
+                continue
+            members = nets.setdefault(net, [])
+            if not members or members[-1] != i:
+                members.append(i)
+    return [members for members in nets.values() if len(members) > 1]
+
+class _Bisection(object):
+    """
+    Fiduccia-Mattheyses style min-cut bisection of some of the parts. The weight of side 0 has to be
+    between low and high (so both sides fit their groups), the cut comes first after that, then getting
+    close to target.
+    """
+    def __init__(self, vertices, low, target, high, weights, nets, vertex_nets):
+        self.vertices = vertices
+        self.low = low
+        self.target = target
+        self.high = high
+        self.weights = weights
+        self.nets = nets
+        self.vertex_nets = vertex_nets
+
+        # moves can go as far out of range as the heaviest part (or it could never move),
+        # but only the states in range are kept
+        total_weight = sum(weights[v] for v in vertices)
+        self.tolerance = max(total_weight / 20, 1)
+        self.move_tolerance = max(max(weights[v] for v in vertices), self.tolerance)
+
+        self.side = {}
+        order = self._bfs_order()
+        self.side_weight = [0, 0]
+        for v in order:
+            s = 0 if not self.side_weight[1] and self.side_weight[0] + weights[v] / 2 <= target else 1
+            self.side[v] = s
+            self.side_weight[s] += weights[v]
+        if not self.side_weight[0] or not self.side_weight[1]:
+            # everything ended up on one side, move the last (or first) one over
+            v = order[-1] if not self.side_weight[1] else order[0]
+            self.side_weight[self.side[v]] -= weights[v]
+            self.side[v] ^= 1
+            self.side_weight[self.side[v]] += weights[v]
+
+        self.side_size = [0, 0]
+        for v in vertices:
+            self.side_size[self.side[v]] += 1
+
+        # only the nets and pins inside this bisection matter
+        self.local_nets = collections.OrderedDict()
+        for v in vertices:
+            for e in vertex_nets[v]:
+                self.local_nets.setdefault(e, [0, 0])[self.side[v]] += 1
+
+    def _bfs_order(self):
+        """Vertices in breadth first order (from a far away one), so the initial split is somewhat local."""
+        members = set(self.vertices)
+
+        def bfs(start, seen):
+            order = [start]
+            seen.add(start)
+            seen_nets = set()
+            for v in order:
+                for e in self.vertex_nets[v]:
+                    if e in seen_nets:
+                        continue
+                    seen_nets.add(e)
+                    for other in self.nets[e]:
+                        if other in members and other not in seen:
+                            seen.add(other)
+                            order.append(other)
+            return order
+
+        order = []
+        seen = set()
+        for v in self.vertices:
+            if v in seen:
+                continue
+            # the last vertex reached is a good (pseudo peripheral) start
+            start = bfs(v, set())[-1]
+            order += bfs(start, seen)
+        return order
+
+    def gain(self, v):
+        """How many less nets are cut if v moves to the other side."""
+        s = self.side[v]
+        gain = 0
+        for e in self.vertex_nets[v]:
+            counts = self.local_nets[e]
+            if counts[s] == 1:
+                gain += 1
+            if counts[1 - s] == 0:
+                gain -= 1
+        return gain
+
+    def _imbalance(self, side_weight0):
+        return abs(side_weight0 - self.target)
+
+    def _out_of_range(self, side_weight0):
+        return max(self.low - side_weight0, side_weight0 - self.high, 0)
+
+    def _move(self, v, gains, heaps):
+        """Moves v to the other side, updating the gains of the affected free vertices (in heaps, one per side)."""
+        f = self.side[v]
+        t = 1 - f
+
+        def bump(e, side, delta, only_one=False):
+            for other in self.nets[e]:
+                if other not in gains or self.side[other] != side:
+                    continue # locked, or not part of this bisection
+                gains[other] += delta
+                heapq.heappush(heaps[side], (-gains[other], other))
+                if only_one:
+                    break
+
+        for e in self.vertex_nets[v]:
+            counts = self.local_nets[e]
+            if counts[t] == 0:
+                bump(e, f, +1)
+            elif counts[t] == 1:
+                bump(e, t, -1, only_one=True)
+            counts[f] -= 1
+            counts[t] += 1
+            if counts[f] == 0:
+                bump(e, t, -1)
+            elif counts[f] == 1:
+                bump(e, f, +1, only_one=True)
+
+        self.side[v] = t
+        self.side_weight[f] -= self.weights[v]
+        self.side_weight[t] += self.weights[v]
+        self.side_size[f] -= 1
+        self.side_size[t] += 1
+
+    def _candidate(self, heap, gains):
+        """(priority, vertex) of the best vertex to move out of one side, or None if that side can't move now."""
+        while heap and gains.get(heap[0][1]) != -heap[0][0]:
+            heapq.heappop(heap) # stale, or already moved
+
+        if not heap:
+            return None
+        v = heap[0][1]
+        s = self.side[v]
+        if self.side_size[s] == 1:
+            return None
+
+        out_of_range = self._out_of_range(self.side_weight[0])
+        new_out_of_range = self._out_of_range(self.side_weight[0] + (self.weights[v] if s else -self.weights[v]))
+        if new_out_of_range > self.move_tolerance and new_out_of_range >= out_of_range:
+            return None
+
+        # moves that keep the weights in range (or bring them closer) first, the gain only after that,
+        # otherwise a heavy part with a good gain can throw off a tight range for the whole pass
+        return (not new_out_of_range or new_out_of_range < out_of_range, gains[v]), v
+
+    def refine(self):
+        """
+        One pass: move every vertex at most once (the best of the two sides' best gains first),
+        keep the best prefix of moves.
+        """
+        gains = {v: self.gain(v) for v in self.vertices}
+        heaps = [[], []]
+        for v, gain in gains.items():
+            heaps[self.side[v]].append((-gain, v))
+        for heap in heaps:
+            heapq.heapify(heap)
+
+        def score(gain):
+            # the groups have to fit, then the cut, then the balance
+            side_weight0 = self.side_weight[0]
+            return (not self._out_of_range(side_weight0), gain, -self._imbalance(side_weight0))
+
+        moves = []
+        total_gain = 0
+        best_score = score(0)
+        best_moves = 0
+
+        while True:
+            candidates = [candidate for candidate in (self._candidate(heap, gains) for heap in heaps) if candidate]
+            if not candidates:
+                break
+            priority, v = max(candidates)
+
+            total_gain += gains.pop(v)
+            self._move(v, gains, heaps)
+            moves.append(v)
+
+            if score(total_gain) > best_score:
+                best_score, best_moves = score(total_gain), len(moves)
+
+        # undo everything after the best point
+        for v in reversed(moves[best_moves:]):
+            self._move(v, {}, heaps)
+
+        return best_score[1], best_moves
+
+    def sides(self):
+        return ([v for v in self.vertices if self.side[v] == 0],
+                [v for v in self.vertices if self.side[v] == 1])
+
+def partition_parts(parts, max_weight, weight=_pin_count, passes=8):
+    """
+    Splits parts in groups of about max_weight (by default pin count, weight(part) can change that),
+    cutting as few nets as possible. Power and ground nets don't count.
+
+    The parts are split in two (a breadth first split, then Fiduccia-Mattheyses passes moving single parts
+    across), and again, until there's the right number of groups. Each side has to fit its share of the
+    groups, so no group goes over max_weight unless a single part is heavier than that (it gets a group of its own).
+    Tiny groups left over at the end are merged.
+
+    Returns a list of groups (lists of parts, in the original order).
+    """
+    parts = list(parts)
+    weights = [weight(part) for part in parts]
+    nets = _part_nets(parts)
+    vertex_nets = [[] for part in parts]
+    for e, members in enumerate(nets):
+        for v in members:
+            vertex_nets[v].append(e)
+
+    groups = []
+    todo = [(list(range(len(parts))), math.ceil(sum(weights) / max_weight))] if parts else []
+    while todo:
+        vertices, group_count = todo.pop()
+        if group_count <= 1 or len(vertices) == 1:
+            groups.append(vertices)
+            continue
+
+        total_weight = sum(weights[v] for v in vertices)
+        left_count = group_count // 2
+        right_count = group_count - left_count
+        bisection = _Bisection(vertices,
+            total_weight - right_count * max_weight, total_weight * left_count / group_count, left_count * max_weight,
+            weights, nets, vertex_nets)
+        for i in range(passes):
+            gain, moves = bisection.refine()
+            if not moves:
+                break
+
+        for side, side_count in reversed(list(zip(bisection.sides(), (left_count, right_count)))):
+            side_weight = sum(weights[v] for v in side)
+            if side_weight > side_count * max_weight:
+                # there was no way to split it evenly enough, this side needs more groups
+                side_count = math.ceil(side_weight / max_weight)
+            todo.append((side, side_count))
+
+    groups = _merge_small_groups(groups, max_weight, weights, nets, vertex_nets)
+    return [[parts[v] for v in sorted(group)] for group in groups]
+
+def _merge_small_groups(groups, max_weight, weights, nets, vertex_nets):
+    """
+    Heavy parts can throw the bisections off balance and leave tiny groups behind, merge groups that
+    fit together: the ones sharing the most nets first, then the lightest ones.
+    """
+    group_weights = [sum(weights[v] for v in group) for group in groups]
+    group_nets = [set(e for v in group for e in vertex_nets[v]) for group in groups]
+    net_groups = [set() for e in nets]
+    for i, group_net_set in enumerate(group_nets):
+        for e in group_net_set:
+            net_groups[e].add(i)
+
+    def neighbors(i):
+        return set(j for e in group_nets[i] for j in net_groups[e]) - {i}
+
+    heap = []
+    def push(i, j):
+        if group_weights[i] + group_weights[j] <= max_weight:
+            shared = len(group_nets[i] & group_nets[j])
+            heapq.heappush(heap, (-shared, group_weights[i] + group_weights[j], min(i, j), max(i, j)))
+
+    def merge(i, j):
+        for e in group_nets[j]:
+            net_groups[e].discard(j)
+            net_groups[e].add(i)
+        group_nets[i] |= group_nets[j]
+        group_nets[j] = set()
+        groups[i] += groups[j]
+        groups[j] = []
+        group_weights[i] += group_weights[j]
+
+    for i in range(len(groups)):
+        for j in neighbors(i):
+            if i < j:
+                push(i, j)
+    while heap:
+        shared, pair_weight, i, j = heapq.heappop(heap)
+        if (not groups[i] or not groups[j] or group_weights[i] + group_weights[j] != pair_weight or
+                -shared != len(group_nets[i] & group_nets[j])):
+            continue # stale, one of them got merged with something else already
+        merge(i, j)
+        for k in neighbors(i):
+            push(i, k)
+
+    # no more connected groups fit together, put the lightest ones together
+    heap = [(group_weight, i) for i, group_weight in enumerate(group_weights) if groups[i]]
+    heapq.heapify(heap)
+    while len(heap) >= 2:
+        (weight_i, i), (weight_j, j) = heapq.heappop(heap), heapq.heappop(heap)
+        if weight_i + weight_j > max_weight:
+            break
+        merge(min(i, j), max(i, j))
+        heapq.heappush(heap, (weight_i + weight_j, min(i, j)))
+
+    return [group for group in groups if group]
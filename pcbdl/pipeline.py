@@ -0,0 +1,275 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export pipeline: many output formats from a single walk through the design.
+"""
+
+from .context import *
+from .defined_at import label_variable_names
+
+import concurrent.futures
+import io
+import json
+import multiprocessing
+
+__all__ = ["export", "export_variants", "JSONSink", "KiCadNetlistSink"]
+
+class PartRecord(object):
+    """What the sinks need to know about a part, computed once for all of them."""
+    __slots__ = ("part", "refdes", "package", "part_number", "value", "populated", "_pins")
+
+    def __init__(self, part, variant=None, i=None):
+        self.part = part
+        self.refdes = part.refdes
+        self.package = getattr(part, "package", None)
+        self.part_number = part.part_number
+        if variant is None:
+            self.value = part.value
+            self.populated = part.populated
+        else:
+            self.value = variant.value(part, i)
+            self.populated = variant.is_populated(part, i)
+        self._pins = None
+
+    @property
+    def pins(self):
+        """((pin number, pin name, net name or None), ...), only figured out if some sink asks."""
+        if self._pins is None:
+            self._pins = tuple((number, pin.name, None if pin._net is None else pin._net.name)
+                for pin in self.part.pins for number in pin.numbers)
+        return self._pins
+
+class NetRecord(object):
+    """What the sinks need to know about a net, computed once for all of them."""
+    __slots__ = ("net", "name", "pins")
+
+    def __init__(self, net):
+        self.net = net
+        self.name = net.name
+        self.pins = tuple((pin.part.refdes, number) for pin in net.connections for number in pin.numbers)
+        """((refdes, pin number), ...)"""
+
+class Sink(object):
+    """
+    Base class for the outputs of :func:`export`. It gets called with:
+
+    * :meth:`begin` once
+    * :meth:`part` for every part, in order
+    * :meth:`parts_done` once
+    * :meth:`net` for every net, in order
+    * :meth:`end`, whose return value ends up in the list :func:`export` returns,
+      or :meth:`abort` if anything went wrong (including the end() of this sink or an earlier one)
+    """
+    def begin(self, context):
+        pass
+
+    def part(self, part):
+        pass
+
+    def parts_done(self):
+        pass
+
+    def net(self, net):
+        pass
+
+    def end(self):
+        pass
+
+    def abort(self):
+        pass
+
+class FileSink(Sink):
+    """A sink that writes to a filename (or an already open file, which is left open)."""
+    def __init__(self, output):
+        self.output = output
+
+    def begin(self, context):
+        if isinstance(self.output, io.IOBase):
+            self.f = self.output
+        else:
+            self.f = open(self.output, "w", newline="")
+
+    def end(self):
+        if self.f is not self.output:
+            self.f.close()
+
+    def abort(self):
+        if getattr(self, "f", None) is not None and self.f is not self.output:
+            self.f.close()
+
+def export(sinks, context=None, variant=None):
+    """
+    Walks through the parts and nets of the context once, and gives each of them
+    (as :class:`PartRecord`/:class:`NetRecord`) to all the sinks. Returns the list of what the sinks' end() returned.
+
+    If a :class:`Variant<pcbdl.Variant>` (or its name) is given, the parts are populated and valued like in that variant.
+
+    Example::
+
+        export([
+            AllegroNetlistSink("board.allegro_third_party"),
+            BOMSink("board.bom.csv"),
+            JSONSink("board.json"),
+        ])
+    """
+    if context is None:
+        context = current_context()
+    if isinstance(variant, str):
+        variant = context.variants[variant]
+    sinks = list(sinks)
+
+    # the schematic is done by now, name what's left and let go of the frames that made it
+    label_variable_names()
+
+    started = []
+    try:
+        for sink in sinks:
+            sink.begin(context)
+            started.append(sink)
+
+        for i, part in enumerate(context.parts_list):
+            record = PartRecord(part, variant, i)
+            for sink in sinks:
+                sink.part(record)
+
+        for sink in sinks:
+            sink.parts_done()
+
+        for net in context.net_list:
+            record = NetRecord(net)
+            for sink in sinks:
+                sink.net(record)
+    except BaseException:
+        for sink in started:
+            sink.abort()
+        raise
+
+    results = []
+    for i, sink in enumerate(sinks):
+        try:
+            results.append(sink.end())
+        except BaseException:
+            # this sink and the ones after it never finished, clean them up too
+            for sink in sinks[i:]:
+                sink.abort()
+            raise
+    return results
+
+_forked_export = None # (context, make_sinks) for the forked processes of export_variants()
+
+def _export_forked_variant(variant_name):
+    context, make_sinks = _forked_export
+    return export(make_sinks(variant_name), context, variant_name)
+
+def export_variants(make_sinks, context=None, variants=None, processes=None):
+    """
+    Exports every variant (all of :attr:`Context.variants<pcbdl.Context.variants>` by default) of the design,
+    the schematic only ran once. ``make_sinks(variant name)`` gives the list of sinks for each variant::
+
+        export_variants(lambda name: [BOMSink("board.%s.bom.csv" % name)])
+
+    Returns {variant name: list of what the sinks' end() returned}.
+
+    With processes > 1 the variants are exported in parallel by that many forked processes (they already
+    have the design in memory, nothing needs to be pickled but the results). Where fork isn't available
+    they're done one after the other.
+    """
+    if context is None:
+        context = current_context()
+    if variants is None:
+        variants = list(context.variants)
+
+    if processes is None or processes <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return {name: export(make_sinks(name), context, name) for name in variants}
+
+    global _forked_export
+    _forked_export = (context, make_sinks)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = [(name, executor.submit(_export_forked_variant, name)) for name in variants]
+            return {name: future.result() for name, future in futures}
+    finally:
+        _forked_export = None
+
+class JSONSink(FileSink):
+    """``{"parts": [...], "nets": [...]}``, written one part/net at a time."""
+    def begin(self, context):
+        super().begin(context)
+        self.f.write('{"parts": [')
+        self.separator = "\n"
+
+    def _write(self, item):
+        self.f.write(self.separator)
+        self.f.write(json.dumps(item))
+        self.separator = ",\n"
+
+    def part(self, part):
+        self._write({
+            "refdes": part.refdes,
+            "package": part.package,
+            "part_number": part.part_number,
+            "value": part.value,
+            "populated": part.populated,
+            "pins": [{"number": number, "name": name, "net": net} for number, name, net in part.pins],
+        })
+
+    def parts_done(self):
+        self.f.write('\n], "nets": [')
+        self.separator = "\n"
+
+    def net(self, net):
+        self._write({
+            "name": net.name,
+            "pins": ["%s.%s" % pin for pin in net.pins],
+        })
+
+    def end(self):
+        self.f.write("\n]}\n")
+        super().end()
+
+def _kicad_quote(s):
+    return '"%s"' % str(s).replace("\\", "\\\\").replace('"', '\\"')
+
+class KiCadNetlistSink(FileSink):
+    """KiCad style (s-expression, version D) netlist, enough for pcbnew to read the connectivity."""
+    def begin(self, context):
+        super().begin(context)
+        self.f.write('(export (version D)\n')
+        self.f.write('  (design (source %s) (tool "pcbdl"))\n' % _kicad_quote(context.name))
+        self.f.write('  (components')
+        self.net_code = 0
+
+    def part(self, part):
+        self.f.write('\n    (comp (ref %s) (value %s)' % (_kicad_quote(part.refdes), _kicad_quote(part.value)))
+        if part.package is not None:
+            self.f.write(' (footprint %s)' % _kicad_quote(part.package))
+        self.f.write('\n      (fields (field (name "Part Number") %s)' % _kicad_quote(part.part_number))
+        if not part.populated:
+            self.f.write(' (field (name "DNS") "1")')
+        self.f.write('))')
+
+    def parts_done(self):
+        self.f.write(')\n  (nets')
+
+    def net(self, net):
+        self.net_code += 1
+        self.f.write('\n    (net (code %d) (name %s)' % (self.net_code, _kicad_quote(net.name)))
+        for refdes, number in net.pins:
+            self.f.write('\n      (node (ref %s) (pin %s))' % (_kicad_quote(refdes), _kicad_quote(number)))
+        self.f.write(')')
+
+    def end(self):
+        self.f.write('))\n')
+        super().end()
@@ -0,0 +1,295 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Binary snapshots of a built design, to export it again without running the schematic.
+
+The file is a header (magic, version) followed by tagged sections. Each section is a flat little endian array:
+a table of all the strings, and the parts, pins, nets, connection groups and variants as columns of
+indexes into it (or into each other).
+"""
+
+from .base import ConnectDirection, Net, Part, PartInstancePin, PinType, _PinList
+from .context import *
+
+import array
+import collections
+import mmap
+import os
+import struct
+import sys
+
+__all__ = ["save_snapshot", "load_snapshot"]
+
+MAGIC = b"PCBDLSNP"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sI")
+_SECTION = struct.Struct("<4scxxxI") # tag, array typecode, item count
+_NONE = -1
+
+_COLUMNS = (
+    b"PREF", b"PPFX", b"PPKG", b"PPNR", b"PVAL", b"PCLS", b"PPIN",
+    b"INAM", b"ANAM", b"INUM", b"ANUM", b"ITYP", b"IWEL",
+    b"NNAM", b"NGRP", b"GMEM", b"MPIN", b"MDIR",
+    b"VNAM", b"VVAL",
+)
+_SECTIONS = (b"CTXN",) + _COLUMNS + (b"PPOP", b"VPOP", b"SOFF", b"SBLB")
+
+_PIN_TYPES = list(PinType)
+_DIRECTIONS = list(ConnectDirection)
+
+class SnapshotError(Exception):
+    pass
+
+class _StringTable(object):
+    def __init__(self):
+        self.indexes = {}
+        self.offsets = array.array("i", (0,))
+        self.blob = bytearray()
+
+    def __call__(self, s):
+        if s is None:
+            return _NONE
+        try:
+            return self.indexes[s]
+        except KeyError:
+            pass
+        i = self.indexes[s] = len(self.offsets) - 1
+        self.blob += str(s).encode("utf8")
+        self.offsets.append(len(self.blob))
+        return i
+
+def _write_section(f, tag, typecode, items):
+    data = array.array(typecode, items)
+    if sys.byteorder != "little":
+        data.byteswap()
+    f.write(_SECTION.pack(tag, typecode.encode("ascii"), len(data)))
+    f.write(data.tobytes())
+    f.write(b"\0" * (-f.tell() % 8)) # keep everything aligned
+
+def save_snapshot(filename, context=None):
+    """Saves the parts, pins, nets (with connection groups) and variants of the context in a snapshot file."""
+    if context is None:
+        context = current_context()
+    strings = _StringTable()
+    parts = context.parts_list
+    columns = collections.OrderedDict((tag, []) for tag in _COLUMNS)
+    populated = []
+
+    pin_indexes = {}
+    for part in parts:
+        columns[b"PREF"].append(strings(part.refdes))
+        columns[b"PPFX"].append(strings(part.REFDES_PREFIX))
+        columns[b"PPKG"].append(strings(getattr(part, "package", None)))
+        columns[b"PPNR"].append(strings(part.part_number))
+        columns[b"PVAL"].append(strings(part.value))
+        columns[b"PCLS"].append(strings(type(part).__qualname__))
+        populated.append(bool(part.populated))
+        columns[b"PPIN"].append(len(pin_indexes))
+        for pin in part.pins:
+            pin_indexes[pin] = len(pin_indexes)
+    columns[b"PPIN"].append(len(pin_indexes))
+
+    for pin in pin_indexes:
+        columns[b"INAM"].append(len(columns[b"ANAM"]))
+        columns[b"ANAM"] += map(strings, pin.names)
+        columns[b"INUM"].append(len(columns[b"ANUM"]))
+        columns[b"ANUM"] += map(strings, pin.numbers)
+        columns[b"ITYP"].append(_PIN_TYPES.index(pin.type))
+        well = getattr(pin, "well", None)
+        columns[b"IWEL"].append(_NONE if well is None else pin_indexes[well])
+    columns[b"INAM"].append(len(columns[b"ANAM"]))
+    columns[b"INUM"].append(len(columns[b"ANUM"]))
+
+    group_count = 0
+    for net in context.net_list:
+        columns[b"NNAM"].append(strings(net.name) if net.has_name else _NONE)
+        columns[b"NGRP"].append(group_count)
+        for group in net._connections:
+            group_count += 1
+            columns[b"GMEM"].append(len(columns[b"MPIN"]))
+            for pin, direction in group.items():
+                columns[b"MPIN"].append(pin_indexes[pin])
+                columns[b"MDIR"].append(_DIRECTIONS.index(direction))
+    columns[b"NGRP"].append(group_count)
+    columns[b"GMEM"].append(len(columns[b"MPIN"]))
+
+    variant_populated = []
+    for variant in context.variants.values():
+        columns[b"VNAM"].append(strings(variant.name))
+        for i, part in enumerate(parts):
+            variant_populated.append(variant.is_populated(part, i))
+            value = variant.value(part, i)
+            columns[b"VVAL"].append(_NONE if value is part.value else strings(value))
+
+    with open(filename, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION))
+        _write_section(f, b"CTXN", "i", (strings(context.name),))
+        for tag, column in columns.items():
+            _write_section(f, tag, "i", column)
+        _write_section(f, b"PPOP", "B", populated)
+        _write_section(f, b"VPOP", "B", variant_populated)
+        _write_section(f, b"SOFF", "i", strings.offsets)
+        _write_section(f, b"SBLB", "B", strings.blob)
+
+def _read_sections(buffer, sections):
+    """Fills sections with {tag: array (or memoryview into buffer)}, see :func:`_release_sections`."""
+    if len(buffer) < _HEADER.size:
+        raise SnapshotError("Not a pcbdl snapshot (too short)")
+    magic, version = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not a pcbdl snapshot")
+    if version != VERSION:
+        raise SnapshotError("Snapshot version %d, only version %d can be read, save it again" % (version, VERSION))
+
+    offset = _HEADER.size
+    with memoryview(buffer) as view: # released even if something's wrong, so the file can be closed
+        while offset < len(buffer):
+            if offset + _SECTION.size > len(buffer):
+                raise SnapshotError("Snapshot is truncated (in a section header at byte %d)" % offset)
+            tag, typecode, count = _SECTION.unpack_from(buffer, offset)
+            offset += _SECTION.size
+            try:
+                typecode = typecode.decode("ascii")
+                size = count * array.array(typecode).itemsize
+            except ValueError:
+                raise SnapshotError("Bad type for the %r section of the snapshot" % tag) from None
+            if offset + size > len(buffer):
+                raise SnapshotError("Snapshot is truncated (in the %r section)" % tag)
+            data = view[offset:offset + size]
+            if sys.byteorder == "little":
+                data = data.cast(typecode) # no copies, straight from the mapped file
+            else:
+                data = array.array(typecode, data.tobytes())
+                data.byteswap()
+            sections[tag] = data
+            offset += size + (-(offset + size) % 8)
+
+    missing = [tag for tag in _SECTIONS if tag not in sections]
+    if missing:
+        raise SnapshotError("Snapshot is truncated (missing the %s sections)" % ", ".join(map(repr, missing)))
+
+def _release_sections(sections):
+    """The mapped file can't be closed while there are memoryviews into it."""
+    for section in sections.values():
+        if isinstance(section, memoryview):
+            section.release()
+
+class SnapshotPart(Part):
+    """
+    Part loaded from a snapshot: same attributes as the original one (:attr:`class_name` is the name of its class),
+    but no plugins, so only the outputs that don't need the source code (netlists, BOM, diffs...) work with it.
+    """
+    class_name = None
+
+    def __repr__(self):
+        return self.refdes
+
+class Snapshot(Context):
+    """A :class:`Context<pcbdl.Context>` read from a snapshot file, see :func:`load_snapshot`."""
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise SnapshotError("Not a pcbdl snapshot (too short)") # can't even be mapped if it's empty
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                sections = {}
+                try:
+                    _read_sections(mapped_file, sections)
+                    self._load(sections)
+                finally:
+                    _release_sections(sections)
+
+    def _load(self, sections):
+        offsets, blob = sections[b"SOFF"], bytes(sections[b"SBLB"])
+        strings = [blob[offsets[i]:offsets[i + 1]].decode("utf8") for i in range(len(offsets) - 1)]
+        strings.append(None) # so _NONE (-1) reads as None
+
+        Context.__init__(self, strings[sections[b"CTXN"][0]])
+
+        # pins first, without their parts
+        pin_names, pin_numbers = sections[b"ANAM"], sections[b"ANUM"]
+        name_starts, number_starts = sections[b"INAM"], sections[b"INUM"]
+        pins = []
+        for i, pin_type in enumerate(sections[b"ITYP"]):
+            pin = PartInstancePin.__new__(PartInstancePin)
+            pin.names = tuple(strings[n] for n in pin_names[name_starts[i]:name_starts[i + 1]])
+            pin.numbers = tuple(strings[n] for n in pin_numbers[number_starts[i]:number_starts[i + 1]])
+            pin.type = _PIN_TYPES[pin_type]
+            pins.append(pin)
+        for pin, well in zip(pins, sections[b"IWEL"]):
+            if well != _NONE:
+                pin.well_name = pins[well].name
+                pin.well = pins[well]
+
+        pin_starts = sections[b"PPIN"]
+        for i, refdes in enumerate(sections[b"PREF"]):
+            part = SnapshotPart.__new__(SnapshotPart)
+            part._refdes = strings[refdes]
+            part.REFDES_PREFIX = strings[sections[b"PPFX"][i]]
+            package = strings[sections[b"PPKG"][i]]
+            if package is not None:
+                part.package = package
+            part.part_number = strings[sections[b"PPNR"][i]]
+            part.value = strings[sections[b"PVAL"][i]]
+            part.populated = bool(sections[b"PPOP"][i])
+            part.class_name = strings[sections[b"PCLS"][i]]
+
+            part.pins = _PinList()
+            for pin in pins[pin_starts[i]:pin_starts[i + 1]]:
+                pin.part = part
+                part.pins[pin.name] = pin
+                for name in pin.names:
+                    part.__dict__[name] = pin
+
+            self._part_indexes[part] = len(self.parts_list)
+            self.parts_list.append(part)
+
+        group_starts, member_pins, member_directions = sections[b"GMEM"], sections[b"MPIN"], sections[b"MDIR"]
+        net_groups = sections[b"NGRP"]
+        for i, name in enumerate(sections[b"NNAM"]):
+            net = Net.__new__(Net)
+            if name != _NONE:
+                net.name = strings[name]
+            net._connections = []
+            for group in range(net_groups[i], net_groups[i + 1]):
+                members = collections.OrderedDict()
+                for member in range(group_starts[group], group_starts[group + 1]):
+                    pin = pins[member_pins[member]]
+                    members[pin] = _DIRECTIONS[member_directions[member]]
+                    pin._net = net
+                net._connections.append(members)
+            self.net_list.append(net)
+            self.named_nets[net.name] = net
+
+        part_count = len(self.parts_list)
+        variant_values, variant_populated = sections[b"VVAL"], sections[b"VPOP"]
+        for v, name in enumerate(sections[b"VNAM"]):
+            variant = self.new_variant(strings[name])
+            for i, part in enumerate(self.parts_list):
+                if bool(variant_populated[v * part_count + i]) != part.populated:
+                    if part.populated:
+                        variant.depopulate(part)
+                    else:
+                        variant.populate(part)
+                value = variant_values[v * part_count + i]
+                if value != _NONE:
+                    variant.set_value(part, strings[value])
+
+def load_snapshot(filename):
+    """
+    Reads a snapshot saved with :func:`save_snapshot` (through a memory map). Returns a
+    :class:`Context<pcbdl.Context>` with the same parts, pins, nets and variants, ready for the exporters.
+    """
+    return Snapshot(filename)
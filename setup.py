@@ -29,6 +29,7 @@ setuptools.setup(
     license="Apache-2.0",
     url="https://github.com/google/pcbdl",
     packages=setuptools.find_packages(),
+    package_data={"pcbdl": ["*.js"]},
     keywords=["eda", "hdl", "electronics", "netlist", "hardware", "schematics"],
     install_requires=["pygments"],
     classifiers=[
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import pathlib
+import tempfile
+import unittest
+from pcbdl import *
+import pcbdl.allegro
+
+class AllegroTest(unittest.TestCase):
+    def setUp(self):
+        self.context = Context()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_location = pathlib.Path(self.tmp_dir.name) / "netlist"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_design(self):
+        """Small design in its own context, instead of the global one."""
+        with self.context:
+            vcc, gnd = Net("VCC"), Net("GND")
+            vcc ^ R("1k", package="0402") ^ gnd
+            for i in range(30):
+                vcc << C("100nF", to=gnd, package="0402")
+        self.context.autoname()
+
+    def test_join_across_lines(self):
+        self.assertEqual(pcbdl.allegro.join_across_lines([]), "")
+        self.assertEqual(pcbdl.allegro.join_across_lines("abc", count=2), "a b ,\nc")
+        self.assertEqual(pcbdl.allegro.join_across_lines(iter("abcd"), count=2), "a b ,\nc d")
+
+    def test_generate_netlist(self):
+        self.make_design()
+        generate_netlist(self.output_location, context=self.context, buffer_size=16)
+
+        contents = (self.output_location / "frompcbdl.netlist.rpt").read_text()
+        self.assertTrue(contents.startswith("(NETLIST)\n"))
+        self.assertTrue(contents.endswith("\n$END"))
+        self.assertIn("'0402' ! '100nF' ; C1 C2", contents)
+        self.assertIn("VCC ; R1.1 C1.1", contents)
+
+        self.assertTrue((self.output_location / "devices" / "100nF.txt").exists())
+
+    def test_incremental(self):
+        self.make_design()
+        changed = generate_netlist(self.output_location, context=self.context, include_date=False)
+        self.assertEqual(len(changed), 3, "netlist and 2 device files")
+
+        netlist_file = self.output_location / "frompcbdl.netlist.rpt"
+        old_contents = netlist_file.read_bytes()
+        old_mtime = netlist_file.stat().st_mtime_ns
+        stale_file = self.output_location / "devices" / "stale.txt"
+        stale_file.write_text("left over")
+
+        changed = generate_netlist(self.output_location, context=self.context, include_date=False)
+        self.assertEqual(changed, [])
+        self.assertEqual(netlist_file.read_bytes(), old_contents)
+        self.assertEqual(netlist_file.stat().st_mtime_ns, old_mtime)
+        self.assertFalse(stale_file.exists())
+
+        self.context.parts_list[0].refdes = "R100"
+        changed = generate_netlist(self.output_location, context=self.context, include_date=False)
+        self.assertEqual(changed, [str(netlist_file)])
+        self.assertEqual(sorted(p.name for p in self.output_location.iterdir()), ["devices", "frompcbdl.netlist.rpt"])
+
+    def test_workers(self):
+        self.make_design()
+        serial_dir = pathlib.Path(self.tmp_dir.name) / "serial"
+        serial_changed = generate_netlist(serial_dir, context=self.context, include_date=False)
+        parallel_changed = generate_netlist(self.output_location, context=self.context, include_date=False, workers=4)
+
+        self.assertEqual([pathlib.Path(f).relative_to(serial_dir) for f in serial_changed],
+                         [pathlib.Path(f).relative_to(self.output_location) for f in parallel_changed])
+        for f in serial_changed:
+            relative = pathlib.Path(f).relative_to(serial_dir)
+            self.assertEqual(pathlib.Path(f).read_bytes(), (self.output_location / relative).read_bytes())
+
+    def test_device_file_errors(self):
+        self.make_design()
+        bad_part = self.context.parts_list[0]
+        bad_part.part_number = "no/such/folder"
+
+        with self.assertRaises(pcbdl.allegro.DeviceFileError) as cm:
+            generate_netlist(self.output_location, context=self.context, workers=2)
+        self.assertEqual(list(cm.exception.errors.keys()), ["no/such/folder.txt"])
+        self.assertTrue((self.output_location / "devices" / "100nF.txt").exists(), "the other files should still be there")
+
+class ImportTest(unittest.TestCase):
+    SERVO_NETLIST = pathlib.Path(__file__).parent / "integration" / "servo_original.rpt"
+
+    def test_continuation_lines(self):
+        lines = [
+            "(NETLIST)",
+            "$PACKAGES",
+            "'CAPC0603' ! 'CAP-(0201,CAPC05,",
+            "        025X13N)' ! '0.1uF' ; C1 C2 ,",
+            "        C3",
+            "R0402 ! 1k ; R1",
+            "$NETS",
+            "GND ; C1.1 C2.1 ,",
+            "C3.1 R1.2",
+            "$END",
+        ]
+        netlist = pcbdl.allegro.read_netlist(io.StringIO("\n".join(lines)))
+        self.assertEqual(netlist.header, ("(NETLIST)",))
+        self.assertEqual(list(netlist.parts), ["C1", "C2", "C3", "R1"])
+        self.assertEqual(netlist.parts["C3"].part_number, "CAP-(0201,CAPC05025X13N)")
+        self.assertEqual(netlist.parts["C3"].value, "0.1uF")
+        self.assertEqual(netlist.parts["R1"], pcbdl.allegro.ImportedPart("R1", "R0402", "1k", None))
+        self.assertEqual(netlist.nets["GND"].pins, (("C1", "1"), ("C2", "1"), ("C3", "1"), ("R1", "2")))
+
+        with self.assertRaises(TypeError):
+            netlist.nets["VCC"] = None
+
+    def test_syntax_error(self):
+        with self.assertRaises(pcbdl.allegro.NetlistSyntaxError):
+            pcbdl.allegro.read_netlist(io.StringIO("$NETS\nGND C1.1\n$END"))
+        with self.assertRaises(pcbdl.allegro.NetlistSyntaxError):
+            pcbdl.allegro.read_netlist(io.StringIO("$NETS\nGND ; C1\n$END"))
+
+    def test_read_servo(self):
+        netlist = read_netlist(self.SERVO_NETLIST)
+        self.assertEqual(len(netlist.parts), 71)
+        self.assertEqual(len(netlist.nets), 90)
+        self.assertEqual(netlist.parts["U23"].package, "BGA4C40P2X2_80X80X56")
+        self.assertEqual(netlist.nets["USB_ID"].pins, (("CN1", "4"), ("Q4", "G"), ("R22", "2")))
+
+    def test_import_and_export(self):
+        context = import_netlist(self.SERVO_NETLIST, Context())
+        self.assertEqual(len(context.parts_list), 71)
+        self.assertEqual(len(context.net_list), 90)
+        self.assertNotIn(context.parts_list[0], global_context.parts_list)
+
+        q4 = context.parts_list[[part.refdes for part in context.parts_list].index("Q4")]
+        self.assertEqual(q4.G.net.name, "USB_ID")
+
+        # what gets exported should read back the same
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        generate_netlist(tmp_dir.name, context=context)
+        original = read_netlist(self.SERVO_NETLIST)
+        exported = read_netlist(pathlib.Path(tmp_dir.name) / "frompcbdl.netlist.rpt")
+        self.assertEqual({net.name: sorted(net.pins) for net in exported.nets.values()},
+                         {net.name: sorted(net.pins) for net in original.nets.values()})
+        self.assertEqual({part.refdes: part.part_number for part in exported.parts.values()},
+                         {part.refdes: part.part_number for part in original.parts.values()})
+
+if __name__ == "__main__":
+    unittest.main()
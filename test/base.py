@@ -14,8 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gc
+import importlib.util
+import inspect
+import os
+import sys
+import tempfile
 import unittest
+import weakref
 from pcbdl import *
+import pcbdl.defined_at
 
 class TestNet(unittest.TestCase):
     def test_create(self):
@@ -100,6 +108,194 @@ class DefinedAtTest(unittest.TestCase):
         n = tp.net
         self.check_defined_at(n)
 
+    def test_lazy(self):
+        """defined_at is only formatted when read, then it's cached"""
+        n = Net()
+        self.assertNotIn("defined_at", n.__dict__)
+        defined_at = n.defined_at
+        self.assertIs(n.__dict__["defined_at"], defined_at)
+
+    def test_tracking_disabled(self):
+        pcbdl.defined_at.TRACK_SOURCE = False
+        try:
+            n = Net()
+            self.assertFalse(hasattr(n, "defined_at"))
+            with self.assertRaises(pcbdl.defined_at.SourceTrackingDisabled):
+                generate_html()
+        finally:
+            pcbdl.defined_at.TRACK_SOURCE = True
+
+class SourceCacheTest(unittest.TestCase):
+    def test_lines(self):
+        cache = pcbdl.defined_at.SourceCache(max_files=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = [os.path.join(tmp_dir, "%d.py" % i) for i in range(3)]
+            for filename in filenames:
+                with open(filename, "w") as f:
+                    f.write("a = 1\r\nb = 2\n")
+
+            self.assertEqual(cache.lines(filenames[0]), ("a = 1", "b = 2", ""))
+
+            # changed files get read again
+            with open(filenames[0], "w") as f:
+                f.write("c = 3\n")
+            self.assertEqual(cache.text(filenames[0]), "c = 3\n")
+
+            # only the last used files are kept
+            for filename in filenames:
+                cache.lines(filename)
+            self.assertEqual(list(cache._files), filenames[1:])
+
+    def test_class_location(self):
+        filename, line = pcbdl.defined_at.class_location(SourceCacheTest)
+        self.assertEqual(os.path.basename(filename), os.path.basename(__file__))
+        self.assertIn("class SourceCacheTest", pcbdl.defined_at.source_cache.lines(filename)[line - 1])
+
+    def test_class_scopes(self):
+        source = (
+            "classThing = 1\n"
+            "class Thing:\n"
+            "    class Inner: pass\n"
+            "def f():\n"
+            "    class Thing: pass\n"
+            "    return Thing\n"
+            "def g():\n"
+            "    if True:\n"
+            "        class Thing: pass\n"
+            "    return Thing\n"
+        )
+        classes = pcbdl.defined_at._find_classes(source.split("\n"))
+        self.assertEqual(classes, {"Thing": 2, "Thing.Inner": 3, "f.<locals>.Thing": 5, "g.<locals>.Thing": 9})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "things.py")
+            with open(filename, "w") as f:
+                f.write(source)
+            spec = importlib.util.spec_from_file_location("pcbdl_test_things", filename)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module # where inspect looks for the file
+            try:
+                spec.loader.exec_module(module)
+                self.assertEqual(pcbdl.defined_at.class_location(module.f()), (filename, 5))
+                self.assertEqual(pcbdl.defined_at.class_location(module.g()), (filename, 9))
+
+                # the file changed, it gets scanned again
+                with open(filename, "w") as f:
+                    f.write("\n" + source)
+                self.assertEqual(pcbdl.defined_at.class_location(module.f()), (filename, 6))
+            finally:
+                del sys.modules[spec.name]
+
+class VariableNameTest(unittest.TestCase):
+    def test_variable_name(self):
+        some_net = Net()
+        some_part = R()
+        self.assertEqual(some_net.variable_name, "some_net")
+        self.assertEqual(some_part.variable_name, "some_part")
+
+        with self.assertRaises(AttributeError):
+            R().variable_name
+
+    def test_loop(self):
+        """Variables that get reassigned in a loop still name every instance they held"""
+        parts = []
+        for i in range(3):
+            looped_part = R()
+            parts.append(looped_part)
+            Net() << looped_part
+        for part in parts:
+            self.assertEqual(part.variable_name, "looped_part")
+
+    def test_frames_let_go(self):
+        def make_part():
+            made_in_function = R()
+            return made_in_function
+
+        pcbdl.defined_at.label_variable_names() # start clean
+        namespace = {"R": R}
+        exec("made_in_module = R()", namespace)
+        parts = [make_part() for i in range(5)]
+        unlabeled = pcbdl.defined_at._unlabeled
+        self.assertIs(unlabeled[id(namespace)], namespace, "module level code only leaves its namespace")
+        self.assertEqual(sum(1 for key in unlabeled if inspect.isframe(key)), 5)
+
+        old_max = pcbdl.defined_at.MAX_UNLABELED_FRAMES
+        pcbdl.defined_at.MAX_UNLABELED_FRAMES = 3
+        try:
+            parts += [make_part() for i in range(10)]
+            self.assertLessEqual(len(unlabeled), 3)
+        finally:
+            pcbdl.defined_at.MAX_UNLABELED_FRAMES = old_max
+
+        export([], Context())
+        self.assertEqual(unlabeled, {})
+        self.assertEqual(namespace["made_in_module"].variable_name, "made_in_module")
+        for part in parts:
+            self.assertEqual(part.variable_name, "made_in_function")
+
+    def test_volatile_names_let_go(self):
+        namespace = {}
+        exec("def f():\n    for i in range(2):\n        x = i\n    y = 1", namespace)
+        code = namespace.pop("f").__code__
+        self.assertEqual(pcbdl.defined_at._volatile_names(code), ("i", "x"))
+        self.assertIn(code, pcbdl.defined_at._volatile_names_cache)
+
+        code_ref = weakref.ref(code)
+        del code
+        gc.collect()
+        self.assertIsNone(code_ref())
+
+class CachedPinsPart(Part):
+    cache_pins = True
+    PINS = ["A", ("B", "BB")]
+
+class PinsTest(unittest.TestCase):
+    def test_normalized_at_class_creation(self):
+        class SomePart(Part):
+            PINS = ["A", ("B", "BB")]
+
+        self.assertIsInstance(SomePart.PINS, pcbdl.base.PinFragmentList)
+        self.assertEqual(SomePart.PINS[1].names, ("B", "BB"))
+        self.assertIn(os.path.basename(__file__), SomePart.PINS[0].defined_at)
+
+    def test_pins_added_later(self):
+        class SomePart(Part):
+            PINS = ["A"]
+
+        SomePart.PINS.append("B")
+        self.assertEqual(SomePart().B.name, "B")
+
+        SomePart.PINS.append(("C", "CC"))
+        self.assertEqual(SomePart().CC.name, "C")
+
+    def test_cache(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        filename = os.path.join(tmp_dir.name, __name__ + ".pcbdl-pins.pickle")
+
+        old_settings = pcbdl.base.PIN_CACHE, pcbdl.base.PIN_CACHE_LOCATION
+        pcbdl.base.PIN_CACHE_LOCATION = tmp_dir.name
+        try:
+            # off by default, nothing gets loaded
+            pcbdl.base.PIN_CACHE = False
+            CachedPinsPart._pins_key = None
+            CachedPinsPart()
+            self.assertNotIn(filename, pcbdl.base._PinCache._files)
+
+            pcbdl.base.PIN_CACHE = True
+            CachedPinsPart._pins_key = None
+            p = CachedPinsPart()
+            self.assertEqual(p.BB.name, "B")
+            self.assertEqual(pcbdl.base._PinCache.filename(CachedPinsPart), filename)
+            pcbdl.base._PinCache.save()
+        finally:
+            pcbdl.base.PIN_CACHE, pcbdl.base.PIN_CACHE_LOCATION = old_settings
+
+        # as if it's a new run
+        del pcbdl.base._PinCache._files[filename]
+        fingerprint, pins = pcbdl.base._PinCache.load(filename)["CachedPinsPart"]
+        self.assertEqual([pin.names for pin in pins], [pin.names for pin in CachedPinsPart.pins])
+
 class PartTest(unittest.TestCase):
     def test_automatic_name_collision(self):
         """Can we make a lot of uniquely named resistors"""
@@ -129,5 +325,24 @@ class PartTest(unittest.TestCase):
         self.assertIn(p.refdes, str(p))
         self.assertIn(p.refdes, repr(p))
 
+class ContextTest(unittest.TestCase):
+    def test_with(self):
+        outer, inner = Context("outer"), Context("inner")
+        with outer:
+            outer_net = Net("OUTER_NET")
+            self.assertIs(current_context(), outer)
+            with self.assertRaises(ValueError):
+                with inner:
+                    inner_part = R("1k")
+                    raise ValueError("even on errors the outer context comes back")
+            outer_part = R("1k")
+
+        self.assertIs(pcbdl.context.global_context, global_context)
+        self.assertIs(current_context(), global_context)
+        self.assertEqual(outer.net_list, [outer_net])
+        self.assertEqual(outer.parts_list, [outer_part])
+        self.assertEqual(inner.parts_list, [inner_part])
+        self.assertNotIn(outer_part, global_context.parts_list)
+
 if __name__ == "__main__":
     unittest.main()
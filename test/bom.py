@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import json
+import unittest
+from pcbdl import *
+import pcbdl.bom
+
+class BOMTest(unittest.TestCase):
+    def test_ranges(self):
+        compress = pcbdl.bom.compress_refdes_ranges
+        self.assertEqual(compress([]), "")
+        self.assertEqual(compress(["C3", "C1", "C2", "C4", "C7", "C8", "C10"]), "C1-C4, C7, C8, C10")
+        self.assertEqual(compress(["C7", "C8"], min_range=2), "C7-C8")
+        self.assertEqual(compress(["U2", "TP", "R1", "R2", "R3"]), "R1-R3, U2, TP")
+
+    def test_zero_padded_ranges(self):
+        compress = pcbdl.bom.compress_refdes_ranges
+        self.assertEqual(compress(["C01", "C001", "C1"]), "C1, C01, C001")
+        self.assertEqual(compress(["C008", "C009", "C010", "C011", "C9", "C10"]), "C9, C10, C008-C011")
+        self.assertEqual(compress(["R?m0a300", "R?m0a301", "R?m0a302"]), "R?m0a300, R?m0a301, R?m0a302")
+
+    def test_bom(self):
+        context = Context()
+        with context:
+            gnd = Net("GND")
+            for i in range(40):
+                C("100nF", refdes="C%d" % (i + 1), package="0402", to=gnd)
+            R("1k", refdes="R2", package="0402", to=gnd)
+            C("100nF", refdes="C41", package="0402", to=gnd, populated=False)
+            C("100nF", refdes="C42", package="0603", to=gnd)
+            R("1k", refdes="R1", package="0402", to=gnd)
+
+        output = io.StringIO()
+        generate_bom(output, context=context)
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+        self.assertEqual(rows, [
+            ["quantity", "refdes", "part_number", "package", "value", "populated"],
+            ["40", "C1-C40", "100nF", "0402", "100nF", "True"],
+            ["2", "R1, R2", "1kΩ", "0402", "1kΩ", "True"],
+            ["1", "C41", "100nF", "0402", "100nF", "False"],
+            ["1", "C42", "100nF", "0603", "100nF", "True"],
+        ])
+
+        output = io.StringIO()
+        generate_bom(output, context=context, format="json")
+        rows = json.loads(output.getvalue())
+        self.assertEqual(rows[0], {"quantity": 40, "refdes": "C1-C40", "part_number": "100nF",
+                                   "package": "0402", "value": "100nF", "populated": True})
+
+        output = io.StringIO()
+        generate_bom(output, context=Context(), format="json")
+        self.assertEqual(json.loads(output.getvalue()), [])
+
+        with self.assertRaises(ValueError):
+            generate_bom(output, context=context, format="xls")
+
+if __name__ == "__main__":
+    unittest.main()
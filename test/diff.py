@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pathlib
+import unittest
+from pcbdl import *
+import pcbdl.allegro
+import pcbdl.diff
+
+SERVO_NETLIST = pathlib.Path(__file__).parent / "integration" / "servo_original.rpt"
+
+def make_design(rename_vcc=False, change_value=False, move_pin=False, add_part=False):
+    context = Context()
+    with context:
+        vcc, gnd, sig = Net("VCC_NEW" if rename_vcc else "VCC"), Net("GND"), Net("SIG")
+        r1 = R("10k" if change_value else "1k", refdes="R1", package="0402")
+        r2 = R("1k", refdes="R2", package="0402")
+        c1 = C("100nF", refdes="C1", package="0402")
+        vcc << r1.P1
+        sig << (r1.P2, r2.P1)
+        gnd << (r2.P2,)
+        (gnd if move_pin else vcc) << c1.P1
+        gnd << c1.P2
+        if add_part:
+            C("1uF", refdes="C2", package="0603", to=gnd)
+    return context
+
+class DiffTest(unittest.TestCase):
+    def test_same(self):
+        self.assertEqual(diff_netlists(make_design(), make_design()), [])
+        self.assertEqual(diff_netlists(SERVO_NETLIST, SERVO_NETLIST), [])
+
+    def test_changes(self):
+        changes = diff_netlists(make_design(), make_design(rename_vcc=True, change_value=True, add_part=True))
+        Change = pcbdl.diff.Change
+        self.assertEqual(changes, [
+            Change("part_changed", "R1", {"part_number": "1kΩ", "value": "1kΩ"}, {"part_number": "10kΩ", "value": "10kΩ"}),
+            Change("part_added", "C2", None, {"package": "0603", "part_number": "1uF", "value": "1uF",
+                                              "pins": {"2": "GND"}}),
+            Change("net_renamed", "VCC", "VCC", "VCC_NEW"),
+        ])
+        json.loads(pcbdl.diff.changes_to_json(changes))
+
+        changes = diff_netlists(make_design(add_part=True), make_design())
+        self.assertEqual(changes, [
+            Change("part_removed", "C2", {"package": "0603", "part_number": "1uF", "value": "1uF",
+                                          "pins": {"2": "GND"}}, None),
+        ])
+
+    def test_moved_pin(self):
+        changes = diff_netlists(make_design(), make_design(move_pin=True))
+        kinds = {change.kind for change in changes}
+        self.assertEqual(kinds, {"pin_moved"})
+        self.assertEqual([(c.target, c.old, c.new) for c in changes], [("C1.1", "VCC", "GND")])
+
+    def test_against_netlist(self):
+        imported = import_netlist(SERVO_NETLIST, Context())
+        self.assertEqual(diff_netlists(SERVO_NETLIST, imported), [])
+
+        imported.net_list[0].name = "SOMETHING_ELSE"
+        changes = diff_netlists(SERVO_NETLIST, imported)
+        self.assertEqual([change.kind for change in changes], ["net_renamed"])
+
+class EquivalenceTest(unittest.TestCase):
+    def renumbered_servo(self):
+        """Servo netlist with different refdeses and anonymous net names, but the same circuit."""
+        context = import_netlist(SERVO_NETLIST, Context())
+        for i, part in enumerate(reversed(context.parts_list)):
+            part.refdes = "%s%d" % (part.REFDES_PREFIX, 1000 + i)
+        for i, net in enumerate(context.net_list):
+            if net.name.startswith("N"):
+                net.name = "ANON_NET_%d" % i
+        return context
+
+    def test_equivalent(self):
+        self.assertTrue(check_equivalence(SERVO_NETLIST, SERVO_NETLIST))
+        self.assertTrue(check_equivalence(SERVO_NETLIST, self.renumbered_servo()))
+        self.assertTrue(check_equivalence(make_design(), make_design(move_pin=False)))
+
+    def test_part_props(self):
+        result = check_equivalence(make_design(), make_design(change_value=True))
+        self.assertFalse(result)
+        # R2 was a 1k resistor just like R1, either could be the one that changed
+        self.assertEqual({(d.side, d.kind, d.name) for d in result.differences},
+                         {("a", "part", "R1"), ("a", "part", "R2"), ("b", "part", "R1")})
+        self.assertTrue(check_equivalence(make_design(), make_design(change_value=True), normalize_part_props=True))
+
+    def test_named_net_renamed(self):
+        result = check_equivalence(make_design(), make_design(rename_vcc=True))
+        self.assertFalse(result)
+        self.assertEqual({(d.side, d.kind, d.name) for d in result.differences}, {("a", "net", "VCC"), ("b", "net", "VCC_NEW")})
+
+    def test_swapped_pins(self):
+        context = self.renumbered_servo()
+        usb_dm, usb_dp = context.named_nets["USB_DM"], context.named_nets["USB_DP"]
+        connector_dm = next(pin for pin in usb_dm.connections if pin.part.refdes.startswith("CN"))
+        connector_dp = next(pin for pin in usb_dp.connections if pin.part.refdes.startswith("CN"))
+        connector_dm.numbers, connector_dp.numbers = connector_dp.numbers, connector_dm.numbers
+
+        result = check_equivalence(SERVO_NETLIST, context)
+        self.assertFalse(result)
+        self.assertEqual(result.iterations, 1, "the difference is right next to the nets")
+        self.assertIn(pcbdl.diff.Mismatch("a", "net", "USB_DP", [("3", "CN1"), ("3", "D1"), ("33", "U6")]),
+                      result.differences)
+        self.assertIn(("a", "part", "CN1"), {(d.side, d.kind, d.name) for d in result.differences})
+
+    def test_unknown_part(self):
+        netlist = pcbdl.allegro.read_netlist(SERVO_NETLIST)
+        netlist = netlist._replace(parts={refdes: part for refdes, part in netlist.parts.items() if refdes != "CN1"})
+        with self.assertRaisesRegex(pcbdl.allegro.NetlistSyntaxError, "CN1, which is not in"):
+            check_equivalence(SERVO_NETLIST, netlist)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+// Copyright 2020 Google LLC
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     https://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Stand-in for netlistsvg's render(): an "svg" listing the cells and ports of the netlist.
+//
+// FAKE_NETLISTSVG_CRASH_ONCE=<file>: if the file exists, delete it and crash the whole process.
+// A cell called "FAIL" makes the render fail.
+
+"use strict";
+
+const fs = require("fs");
+
+exports.render = function (skin, netlist, done) {
+  const crashFile = process.env.FAKE_NETLISTSVG_CRASH_ONCE;
+  if (crashFile && fs.existsSync(crashFile)) {
+    fs.unlinkSync(crashFile);
+    process.exit(3);
+  }
+
+  const module = netlist.modules["SVG Output"];
+  const cells = Object.keys(module.cells).sort();
+  if (cells.includes("FAIL")) {
+    const err = new Error("can't draw FAIL");
+    if (done) {
+      done(err);
+    }
+    return Promise.reject(err);
+  }
+
+  const texts = cells.concat(Object.keys(module.ports).sort()).map((name) => "<text>" + name + "</text>");
+  const svg = "<svg skin=\"" + skin.length + "\">" + texts.join("") + "</svg>\n";
+  if (done) {
+    done(null, svg);
+  }
+  return Promise.resolve(svg);
+};
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Rough timing of the slow paths in pcbdl. Not a unit test, just run it:
+
+    test/integration/benchmark.py [name ...]
+"""
+
+import collections
+import io
+import os
+import pathlib
+import runpy
+import sys
+import tempfile
+import timeit
+
+EXAMPLES_DIR = pathlib.Path(__file__).absolute().parent.parent.parent / "examples"
+
+# pcbdl computes defined_at relative to the cwd at import time,
+# be in the same spot as the refdes_mapping files before importing it
+os.chdir(EXAMPLES_DIR)
+import pcbdl
+
+def _reset_global_context():
+    pcbdl.global_context.__init__()
+    pcbdl.nets = pcbdl.context.nets = pcbdl.global_context.named_nets
+
+def run_servo_micro():
+    """Executes the whole servo_micro schematic from scratch."""
+    _reset_global_context()
+    return runpy.run_path(str(EXAMPLES_DIR / "servo_micro.py"), run_name="servo_micro")
+
+def bench_servo_micro(repeat=5):
+    run_servo_micro() # warm up imports and linecache
+    return min(timeit.repeat(run_servo_micro, number=1, repeat=repeat))
+
+def bench_defined_at(count=10000):
+    _reset_global_context()
+    return timeit.timeit(pcbdl.Net, number=count) / count
+
+def bench_big_module(count=1000):
+    """Lots of parts and nets saved in module level variables, like big schematics have."""
+    source = "from pcbdl import *\n" + "".join(
+        "net%d = Net('NET%d'); r%d = R('1k', to=net%d)\n" % (i, i, i, i) for i in range(count))
+    code = compile(source, "big_module.py", "exec")
+
+    def run():
+        _reset_global_context()
+        exec(code, {"__name__": "big_module"})
+        pcbdl.global_context.autoname()
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+def bench_part_library(count=300, pin_count=64):
+    """Import of a library module with lots of big parts, then placing one of each."""
+    source = "from pcbdl import *\n"
+    for i in range(count):
+        source += "class Chip%d(Part):\n    REFDES_PREFIX = 'U'\n    PINS = [\n" % i
+        source += "".join("        Pin('%d', 'PA%d', type=PinType.INPUT),\n" % (n + 1, n) for n in range(pin_count))
+        source += "    ]\n"
+    source += "for i in range(%d):\n    globals()['Chip%%d' %% i]()\n" % count
+    code = compile(source, "part_library.py", "exec")
+
+    def run():
+        _reset_global_context()
+        exec(code, {"__name__": "part_library"})
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+def bench_import_netlist(line_count=1000000):
+    """Reading a synthetic third party netlist with about line_count lines (some of them wrapped)."""
+    part_count = line_count // 10
+    with tempfile.NamedTemporaryFile("w", suffix=".rpt") as f:
+        f.write("(NETLIST)\n$PACKAGES\n")
+        for i in range(part_count):
+            f.write("'R0402' ! 'RES-%d,\n    00' ! '1k' ; R%d\n" % (i % 100, i))
+        f.write("$NETS\n")
+        lines = part_count * 2
+        net = 0
+        while lines < line_count:
+            pins = " ".join("R%d.%d" % ((net * 5 + n) % part_count, n % 2 + 1) for n in range(5))
+            f.write("NET%d ; %s ,\n%s\n" % (net, pins, pins.replace(".1", ".2")))
+            lines += 2
+            net += 1
+        f.write("$END\n")
+        f.flush()
+
+        return min(timeit.repeat(lambda: pcbdl.allegro.read_netlist(f.name), number=1, repeat=3))
+
+def bench_bom(count=300000):
+    """BOM of lots of (fake, pre-made) part records, the grouping and CSV writing only."""
+    from pcbdl.bom import BOMIndex, write_bom_csv
+    Record = collections.namedtuple("Record", "refdes part_number package value populated")
+    values = ["%dnF" % (i * 10) for i in range(100)]
+    records = [Record("C%d" % i, values[i % 100], "0402", values[i % 100], i % 7 != 0) for i in range(count)]
+
+    def run():
+        index = BOMIndex()
+        for record in records:
+            index.add(record)
+        write_bom_csv(io.StringIO(), index.rows())
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+def bench_snapshot(repeat=5):
+    """Loading the servo_micro design from a snapshot, instead of running the schematic (see servo_micro)."""
+    run_servo_micro()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "servo_micro.snapshot")
+        pcbdl.save_snapshot(filename)
+        return min(timeit.repeat(lambda: pcbdl.load_snapshot(filename), number=1, repeat=repeat))
+
+BENCHMARKS = {
+    "servo_micro": ("servo_micro schematic execution", bench_servo_micro, "s"),
+    "defined_at": ("Net() creation (DefinedAt)", bench_defined_at, "s/net"),
+    "big_module": ("1000 nets + 1000 parts at module level", bench_big_module, "s"),
+    "part_library": ("300 part classes x 64 pins library", bench_part_library, "s"),
+    "import_netlist": ("1M line Allegro netlist import", bench_import_netlist, "s"),
+    "bom": ("300k parts BOM", bench_bom, "s"),
+    "snapshot": ("servo_micro snapshot load", bench_snapshot, "s"),
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or BENCHMARKS.keys()
+    for name in names:
+        description, function, units = BENCHMARKS[name]
+        print("%-40s %.6f %s" % (description, function(), units))
@@ -23,6 +23,7 @@ import unittest
 
 import load_example
 import netlist_normalize
+import pcbdl
 
 class NetlistIntegration(unittest.TestCase):
     def test_netlist(self):
@@ -69,6 +70,14 @@ class NetlistIntegration(unittest.TestCase):
             if delta:
                 raise self.failureException(f"Netlists differ:\n{delta}")
 
+            # Same thing, but looking at the circuit instead of the text
+            equivalence = pcbdl.check_equivalence(netlist_dir / "frompcbdl.netlist.rpt",
+                pathlib.Path(__file__).absolute().parent / "servo_original.rpt",
+                normalize_part_props=True)
+            if not equivalence:
+                raise self.failureException("Netlists are not equivalent:\n%s" %
+                    "\n".join(map(str, equivalence.differences)))
+
             # Delete the tmp_dir if we got so far successfully
             shutil.rmtree(str(tmp_dir))
         except Exception:
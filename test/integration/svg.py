@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import unittest
+
+import pcbdl
+
+CHAIN_LENGTH = 10000
+
+class SVGStress(unittest.TestCase):
+    def test_long_chain(self):
+        """A chain of resistors too long to walk recursively (one part pulls in the next) all on one page."""
+        context = pcbdl.Context()
+        with context:
+            resistors = [pcbdl.R("1k", refdes="R%d" % (i + 1)) for i in range(CHAIN_LENGTH)]
+            for i in range(1, len(resistors)):
+                pcbdl.Net("CHAIN%d" % i) << resistors[i - 1].P2 << resistors[i].P1
+
+        page = pcbdl.SVGPage(context=context)
+        with self.assertLogs("pcbdl.netlistsvg", "DEBUG") as logs:
+            cells = json.loads(page.json())["modules"]["SVG Output"]["cells"]
+
+        self.assertEqual(list(cells), [resistor.refdes for resistor in resistors])
+        trace = [record.getMessage() for record in logs.records]
+        self.assertEqual(trace[2], "  R3 - 1kΩ")
+        self.assertEqual(trace[-1], " " * pcbdl.netlistsvg.SVGPart.MAX_TRACE_INDENT + "R%d - 1kΩ" % CHAIN_LENGTH)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pcbdl import *
+import pcbdl.netlistsvg
+
+FAKE_NETLISTSVG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_netlistsvg")
+
+def make_design(last_resistor="1k"):
+    context = Context()
+    with context:
+        vcc, gnd = Net("PP3300"), Net("GND")
+        for i in range(4):
+            signal = Net("SIGNAL%d" % i)
+            signal << R(last_resistor if i == 3 else "1k", refdes="R%d" % (i + 1), to=vcc)
+            signal << C("100nF", refdes="C%d" % (i + 1), to=gnd)
+    return context
+
+def render_pages(renderer, context, **kwargs):
+    return list(generate_svg(context=context, renderer=renderer, **kwargs))
+
+class PaginationTest(unittest.TestCase):
+    def test_pages(self):
+        context = make_design()
+        page = SVGPage(max_pin_count=2, context=context)
+        helpers = page.part_helpers
+        drawn = []
+        cell_types = set()
+        while True:
+            try:
+                cells = json.loads(page.json())["modules"]["SVG Output"]["cells"]
+            except SVGPage.PageEmpty:
+                break
+            cell_types.update(cell["type"] for name, cell in cells.items() if not name.startswith("power_symbol"))
+            self.assertTrue(page.pins_drawn.isdisjoint(drawn))
+            drawn += page.pins_drawn
+            page.next_page()
+            self.assertIs(page.part_helpers, helpers)
+
+        self.assertCountEqual(drawn, [pin for part in context.parts_list for pin in part.pins])
+        self.assertEqual(page.parts_left, {})
+        self.assertEqual(cell_types, {"r_v", "c_v"})
+
+    def test_partition(self):
+        context = make_design()
+        cells = []
+        renderer = CountingRenderer()
+        renderer.render = lambda netlist_json: cells.append(
+            [name for name in json.loads(netlist_json)["modules"]["SVG Output"]["cells"] if "power" not in name])
+        list(generate_svg(context=context, renderer=renderer, max_pin_count=4, partition=True))
+
+        self.assertEqual(len(cells), 4)
+        self.assertCountEqual(sum(cells, []), [part.refdes for part in context.parts_list])
+        for page_cells in cells:
+            # each RC pair is together
+            self.assertEqual(sorted(name[1:] for name in page_cells), [page_cells[0][1:]] * 2)
+
+    def test_partition_over_limit(self):
+        # groups heavier than max_pin_count are still drawn whole, nothing gets lost between the pages
+        context = make_design()
+        page = SVGPage(max_pin_count=4, context=context)
+        page.partition = lambda: [context.parts_list[:6], context.parts_list[6:]]
+        cells = [[name for name in json.loads(page_json)["modules"]["SVG Output"]["cells"] if "power" not in name]
+            for page_json in pcbdl.netlistsvg._layout_pages(page, partition=True)]
+
+        self.assertEqual(len(cells), 2)
+        self.assertEqual(len(cells[0]), 6)
+        self.assertCountEqual(sum(cells, []), [part.refdes for part in context.parts_list])
+
+    def test_current_context(self):
+        # the context is looked up when drawing, not when pcbdl was imported
+        context = make_design()
+        cells = []
+        renderer = CountingRenderer()
+        renderer.render = lambda netlist_json: cells.append(
+            [name for name in json.loads(netlist_json)["modules"]["SVG Output"]["cells"] if "power" not in name])
+        with context:
+            list(generate_svg(renderer=renderer))
+        self.assertCountEqual(sum(cells, []), [part.refdes for part in context.parts_list])
+
+    def test_skin(self):
+        class PullUp(R):
+            pass
+
+        skin = pcbdl.netlistsvg.SVGPart.skin_properties
+        self.assertEqual(skin(PullUp)[0], "r_")
+        self.assertEqual(skin(LED)[0], "d_led_")
+        self.assertEqual(skin(D)[0], "d_")
+        self.assertIsNone(skin(Part))
+        self.assertIn(PullUp, pcbdl.netlistsvg.SVGPart._skin_cache)
+
+    def test_net_regex(self):
+        context = make_design()
+        page = SVGPage(net_regex="SIGNAL[12]", context=context)
+        cells = json.loads(page.json())["modules"]["SVG Output"]["cells"]
+        # whole resistors and capacitors, even if only one side matches
+        self.assertEqual(sorted(name for name in cells if "power" not in name), ["C2", "C3", "R2", "R3"])
+        self.assertEqual(len(page.pins_drawn), 8)
+        self.assertEqual(sorted(net.name for net, matches in page._net_matches.items() if matches), ["SIGNAL1", "SIGNAL2"])
+
+    def test_groups(self):
+        class Chip(Part):
+            REFDES_PREFIX = "U"
+            PINS = ["VCC", "A", "B", "GND"]
+
+        context = Context()
+        with context:
+            vcc = Net("PP3300")
+            chips = [Chip(refdes="U%d" % (i + 1)) for i in range(3)]
+            resistor = R("1k", refdes="R1")
+            vcc << chips[0].VCC << resistor << chips[1].VCC << chips[2].VCC
+
+        page = SVGPage(context=context)
+        helper = page.net_helpers[vcc]
+        helper.categorize_groups()
+        # the first big part stays with the small ones, the others get their own (airwire) groups
+        self.assertEqual([list(group) for group in helper.grouped_connections],
+            [[chips[0].VCC, resistor.P1], [chips[1].VCC], [chips[2].VCC]])
+        self.assertEqual(helper.get_other_pins_in_group(resistor.P1), [chips[0].VCC, resistor.P1])
+        self.assertEqual(helper.get_node_number(chips[2].VCC), page.node_numbers[helper, 2])
+        self.assertNotEqual(helper.get_node_number(chips[1].VCC), helper.get_node_number(chips[0].VCC))
+        with self.assertRaises(ValueError):
+            helper.get_node_number(chips[0].A)
+
+        # pages sharing net_groups only categorize each net once (per airwire mode)
+        net_groups = {}
+        pages = [SVGPage(context=context, net_groups=net_groups, **kwargs)
+            for kwargs in ({}, {"net_regex": "PP.*"}, {"airwires": 0})]
+        for page in pages:
+            page.net_helpers[vcc].categorize_groups()
+        self.assertEqual(len(net_groups), 2)
+        self.assertIs(pages[1].net_helpers[vcc].pin_groups, pages[0].net_helpers[vcc].pin_groups)
+        self.assertEqual(len(pages[2].net_helpers[vcc].grouped_connections), 1)
+
+    def test_views(self):
+        context = make_design()
+        views = {
+            "all": {"max_pin_count": 4},
+            "signal": {"net_regex": "SIGNAL[12]", "airwires": 0},
+            "partitioned": {"max_pin_count": 8, "partition": True},
+        }
+        renderer = CountingRenderer()
+        svgs = generate_svg_views(views, context=context, renderer=renderer)
+        self.assertEqual(list(svgs), list(views))
+        for name, kwargs in views.items():
+            self.assertEqual(svgs[name], render_pages(CountingRenderer(), context, **kwargs), name)
+        self.assertEqual(renderer.count, sum(len(pages) for pages in svgs.values()))
+
+class StripNodeSuffixesTest(unittest.TestCase):
+    def test_chunks(self):
+        svg = '<text id="PP3300_node12">PP3300_node12</text><text>_no_node_</text>_node3'
+        expected = '<text id="PP3300">PP3300</text><text>_no_node_</text>'
+        for size in range(1, len(svg) + 1):
+            chunks = [svg[i:i + size] for i in range(0, len(svg), size)]
+            self.assertEqual("".join(pcbdl.netlistsvg.strip_node_suffixes(chunks)), expected, size)
+
+    def test_read_svg(self):
+        data = '<text>Ω_node1</text>'.encode("utf8")
+        self.assertEqual(pcbdl.netlistsvg._read_svg(io.BytesIO(data)), "<text>Ω</text>")
+        self.assertEqual(pcbdl.netlistsvg._read_svg(io.BytesIO(data + b"more"), len(data)), "<text>Ω</text>")
+        with self.assertRaises(BrokenPipeError):
+            pcbdl.netlistsvg._read_svg(io.BytesIO(data), len(data) + 1)
+
+class CountingRenderer(object):
+    def __init__(self):
+        self.count = 0
+
+    def render(self, netlist_json):
+        self.count += 1
+        return "<svg>%s</svg>" % hashlib.sha1(netlist_json.encode("utf8")).hexdigest()[:8]
+
+    def close(self):
+        pass
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.old_location = pcbdl.netlistsvg.NETLISTSVG_LOCATION
+        pcbdl.netlistsvg.NETLISTSVG_LOCATION = FAKE_NETLISTSVG
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        pcbdl.netlistsvg.NETLISTSVG_LOCATION = self.old_location
+        self.tmp.cleanup()
+
+    def test_cache(self):
+        renderer = CountingRenderer()
+        pages = render_pages(NetlistsvgCache(renderer, self.tmp.name), make_design(), max_pin_count=2)
+        self.assertEqual(renderer.count, len(pages))
+
+        # new process, same design
+        cache = NetlistsvgCache(renderer, self.tmp.name)
+        self.assertEqual(render_pages(cache, make_design(), max_pin_count=2), pages)
+        self.assertEqual(renderer.count, len(pages))
+        self.assertEqual((cache.hits, cache.misses), (len(pages), 0))
+
+        # only the page with the changed part needs to be drawn again
+        changed_pages = render_pages(cache, make_design(last_resistor="2k"), max_pin_count=2)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(sum(a != b for a, b in zip(pages, changed_pages)), 1)
+
+    def test_key(self):
+        cache = NetlistsvgCache(CountingRenderer(), self.tmp.name)
+        key = cache.key("{}")
+        self.assertEqual(NetlistsvgCache(location=self.tmp.name).key("{}"), key)
+        self.assertNotEqual(cache.key("{ }"), key)
+
+        old_version = pcbdl.netlistsvg.netlistsvg_version
+        pcbdl.netlistsvg.netlistsvg_version = lambda: "1.2.3"
+        try:
+            self.assertNotEqual(NetlistsvgCache(location=self.tmp.name).key("{}"), key)
+        finally:
+            pcbdl.netlistsvg.netlistsvg_version = old_version
+
+    def test_eviction(self):
+        renderer = CountingRenderer()
+        cache = NetlistsvgCache(renderer, self.tmp.name, max_size=40)
+        for i in range(10):
+            cache.render('{"page": %d}' % i) # 19 byte svgs
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+
+        cache.render('{"page": 8}')
+        cache.render('{"page": 9}')
+        self.assertEqual(renderer.count, 10)
+        cache.render('{"page": 0}')
+        self.assertEqual(renderer.count, 11)
+
+        # the least recently used one goes first
+        cache.render('{"page": 9}')
+        cache.render('{"page": 1}')
+        self.assertEqual(renderer.count, 12)
+        cache.render('{"page": 9}')
+        self.assertEqual(renderer.count, 12)
+
+@unittest.skipUnless(shutil.which("node"), "needs node")
+class NetlistsvgTest(unittest.TestCase):
+    def setUp(self):
+        self.old_location = pcbdl.netlistsvg.NETLISTSVG_LOCATION
+        pcbdl.netlistsvg.NETLISTSVG_LOCATION = FAKE_NETLISTSVG
+        self.context = make_design()
+
+    def tearDown(self):
+        pcbdl.netlistsvg.NETLISTSVG_LOCATION = self.old_location
+
+    def test_worker(self):
+        with NetlistsvgWorker() as worker:
+            pages = render_pages(worker, self.context, max_pin_count=4)
+            pid = worker.process.pid
+            pages += render_pages(worker, self.context, net_regex="SIGNAL.*")
+            self.assertEqual(worker.process.pid, pid, "should be the same process for all pages")
+        self.assertIsNone(worker.process)
+        self.assertGreater(len(pages), 2)
+        for page in pages:
+            self.assertTrue(page.startswith("<svg"))
+            self.assertNotIn("_node", page)
+
+    def test_same_as_process(self):
+        with NetlistsvgWorker() as worker:
+            from_worker = render_pages(worker, self.context, max_pin_count=4)
+        from_process = render_pages(None, self.context, max_pin_count=4)
+        self.assertEqual(from_worker, from_process)
+
+    def test_parallel(self):
+        serial = render_pages(None, self.context, max_pin_count=2)
+        self.assertGreater(len(serial), 3)
+        self.assertEqual(render_pages(None, self.context, max_pin_count=2, processes=3), serial)
+
+        with NetlistsvgPool(2) as pool:
+            self.assertEqual(render_pages(pool, self.context, max_pin_count=2, processes=4), serial)
+            self.assertLessEqual(len(pool.workers), 2)
+        self.assertEqual(pool.workers, [])
+
+        with NetlistsvgWorker() as worker:
+            self.assertEqual(render_pages(worker, self.context, max_pin_count=2, processes=4), serial)
+
+    def test_quiet(self):
+        """Nothing but the svg should end up on stdout, it could be piped somewhere."""
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            render_pages(None, self.context, max_pin_count=4)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_views(self):
+        views = {"all": {}, "signal": {"net_regex": "SIGNAL.*", "airwires": 0}}
+        svgs = generate_svg_views(views, context=self.context)
+        self.assertEqual(generate_svg_views(views, context=self.context, processes=2), svgs)
+        for name, kwargs in views.items():
+            self.assertEqual(svgs[name], render_pages(None, self.context, **kwargs), name)
+
+    def test_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            crash_file = os.path.join(tmp, "crash")
+            os.environ["FAKE_NETLISTSVG_CRASH_ONCE"] = crash_file
+            try:
+                with NetlistsvgWorker() as worker:
+                    first = render_pages(worker, self.context)
+                    open(crash_file, "w").close()
+                    second = render_pages(worker, self.context)
+                    self.assertEqual(worker.restarts, 1)
+            finally:
+                del os.environ["FAKE_NETLISTSVG_CRASH_ONCE"]
+        self.assertFalse(os.path.exists(crash_file))
+        self.assertEqual(first, second)
+
+    def test_error(self):
+        netlist = {"modules": {"SVG Output": {"cells": {"FAIL": {}}, "netnames": {}, "ports": {}}}}
+        with NetlistsvgWorker() as worker:
+            with self.assertRaisesRegex(pcbdl.netlistsvg.NetlistsvgError, "can't draw FAIL"):
+                worker.render(json.dumps(netlist))
+
+            # still works afterwards
+            netlist["modules"]["SVG Output"]["cells"] = {"R1": {}}
+            self.assertIn("<text>R1</text>", worker.render(json.dumps(netlist)))
+            self.assertEqual(worker.restarts, 0)
+
+if __name__ == "__main__":
+    unittest.main()
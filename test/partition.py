@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from pcbdl import *
+
+class Chip(Part):
+    REFDES_PREFIX = "U"
+    PINS = ["VCC", "GND", "IN", "OUT", "A", "B"]
+
+def make_clusters(cluster_count):
+    """
+    cluster_count chips, each with 2 resistors of its own (10 pins per cluster), the chips are chained
+    OUT to IN and all of them are on the same power and ground nets.
+
+    The parts are created interleaved, so no cluster is together in parts_list.
+    """
+    context = Context()
+    with context:
+        vcc, gnd = Net("PP3300"), Net("GND")
+        chips = [Chip(refdes="U%d" % (i + 1)) for i in range(cluster_count)]
+        clusters = [[chip] for chip in chips]
+        for side in "AB":
+            for i, chip in enumerate(chips):
+                clusters[i].append(R("1k", refdes="R%s%d" % (side, i + 1)))
+                Net("%s_%s" % (chip, side)) << getattr(chip, side) << clusters[i][-1].P1
+                gnd << clusters[i][-1].P2
+        for i, chip in enumerate(chips):
+            vcc << chip.VCC
+            gnd << chip.GND
+            if i:
+                Net("LINK%d" % i) << chips[i - 1].OUT << chip.IN
+    return context, clusters
+
+def cut_nets(groups):
+    group_of = {part: i for i, group in enumerate(groups) for part in group}
+    cut = set()
+    for part, i in group_of.items():
+        for pin in part.pins:
+            net = pin._net
+            if net is None or net.is_power or net.is_gnd:
+                continue
+            if any(group_of[other.part] != i for other in net.connections):
+                cut.add(net.name)
+    return cut
+
+class PartitionTest(unittest.TestCase):
+    def test_clusters(self):
+        context, clusters = make_clusters(8)
+        groups = partition_parts(context.parts_list, 2 * 10)
+
+        self.assertEqual(len(groups), 4)
+        self.assertCountEqual(sum(groups, []), context.parts_list)
+        for group in groups:
+            self.assertEqual(sum(len(part.pins) for part in group), 2 * 10)
+            # whole clusters, 2 of them, next to each other in the chain
+            chips = sorted(int(part.refdes[1:]) for part in group if part.refdes.startswith("U"))
+            self.assertEqual(len(chips), 2)
+            self.assertEqual(chips[1], chips[0] + 1)
+            for chip in chips:
+                for part in clusters[chip - 1]:
+                    self.assertIn(part, group)
+            self.assertEqual(group, [part for part in context.parts_list if part in group])
+
+        # only the chain, the power and ground nets are free
+        self.assertEqual(len(cut_nets(groups)), 3)
+
+    def test_uneven(self):
+        context, clusters = make_clusters(5)
+        groups = partition_parts(context.parts_list, 2 * 10)
+        self.assertEqual(len(groups), 3)
+        for group in groups:
+            self.assertLessEqual(sum(len(part.pins) for part in group), 2 * 10)
+        self.assertLessEqual(len(cut_nets(groups)), 3)
+
+    def test_small(self):
+        context, clusters = make_clusters(2)
+        self.assertEqual(partition_parts(context.parts_list, 1000), [context.parts_list])
+        self.assertEqual(partition_parts([], 10), [])
+
+        # chips are too big for any page, they get one of their own
+        groups = partition_parts(context.parts_list, 4)
+        self.assertCountEqual(sum(groups, []), context.parts_list)
+        self.assertGreaterEqual(len(groups), 4)
+        for group in groups:
+            if len(group) > 1:
+                self.assertLessEqual(sum(len(part.pins) for part in group), 4)
+
+    def test_limit(self):
+        # 70 pins, most of the limits don't line up with the 10 pin clusters
+        context, clusters = make_clusters(7)
+        for max_weight in (15, 20, 25, 30, 40):
+            groups = partition_parts(context.parts_list, max_weight)
+            self.assertCountEqual(sum(groups, []), context.parts_list)
+            for group in groups:
+                self.assertLessEqual(sum(len(part.pins) for part in group), max_weight)
+
+    def test_weight(self):
+        context, clusters = make_clusters(4)
+        groups = partition_parts(context.parts_list, 2, weight=lambda part: part.refdes.startswith("U"))
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(len(cut_nets(groups)), 1)
+
+if __name__ == "__main__":
+    unittest.main()
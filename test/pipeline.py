@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import json
+import pathlib
+import tempfile
+import unittest
+from pcbdl import *
+import pcbdl.pipeline
+
+class RecordingSink(pcbdl.pipeline.Sink):
+    def __init__(self):
+        self.calls = []
+
+    def begin(self, context):
+        self.calls.append("begin")
+
+    def part(self, part):
+        self.calls.append(part)
+
+    def parts_done(self):
+        self.calls.append("parts_done")
+
+    def net(self, net):
+        self.calls.append(net)
+
+    def end(self):
+        self.calls.append("end")
+        return len(self.calls)
+
+    def abort(self):
+        self.calls.append("abort")
+
+class DesignTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = Context("test")
+        with self.context:
+            vcc, gnd = Net("VCC"), Net("GND")
+            vcc ^ R("1k", package="0402") ^ gnd
+            for i in range(3):
+                vcc << C("100nF", to=gnd, package="0402")
+            C("1uF", to=gnd, package="0603", populated=False)
+        self.context.autoname()
+
+class ExportTest(DesignTestCase):
+    def test_single_pass(self):
+        sinks = RecordingSink(), RecordingSink()
+        self.assertEqual(export(sinks, self.context), [10, 10])
+
+        calls = sinks[0].calls
+        self.assertEqual(calls, sinks[1].calls, "both sinks should see the very same records")
+        self.assertEqual(calls[0], "begin")
+        self.assertEqual([part.refdes for part in calls[1:6]], ["R1", "C1", "C2", "C3", "C4"])
+        self.assertEqual(calls[6], "parts_done")
+        self.assertEqual([net.name for net in calls[7:9]], ["VCC", "GND"])
+        self.assertEqual(calls[-1], "end")
+
+    def test_abort(self):
+        class BrokenSink(RecordingSink):
+            def net(self, net):
+                raise ValueError("broken")
+
+        sinks = RecordingSink(), BrokenSink()
+        with self.assertRaises(ValueError):
+            export(sinks, self.context)
+        self.assertEqual(sinks[0].calls[-1], "abort")
+        self.assertNotIn("end", sinks[0].calls)
+
+    def test_abort_in_end(self):
+        class BrokenSink(RecordingSink):
+            def end(self):
+                super().end()
+                raise ValueError("broken")
+
+        sinks = RecordingSink(), BrokenSink(), RecordingSink()
+        with self.assertRaises(ValueError):
+            export(sinks, self.context)
+        self.assertEqual(sinks[0].calls[-1], "end", "already done, nothing to abort")
+        self.assertEqual(sinks[1].calls[-2:], ["end", "abort"])
+        self.assertEqual(sinks[2].calls[-1], "abort")
+        self.assertNotIn("end", sinks[2].calls)
+
+    def test_formats(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        allegro_location = pathlib.Path(tmp_dir.name) / "allegro"
+        json_output, kicad_output, bom_output = io.StringIO(), io.StringIO(), io.StringIO()
+
+        results = export([
+            AllegroNetlistSink(allegro_location, include_date=False),
+            JSONSink(json_output),
+            KiCadNetlistSink(kicad_output),
+            BOMSink(bom_output),
+        ], self.context)
+        self.assertEqual(len(results[0]), 4, "netlist and 3 device files")
+
+        # same as the standalone allegro exporter
+        standalone_location = pathlib.Path(tmp_dir.name) / "standalone"
+        generate_netlist(standalone_location, context=self.context, include_date=False)
+        self.assertEqual((allegro_location / "frompcbdl.netlist.rpt").read_text(),
+                         (standalone_location / "frompcbdl.netlist.rpt").read_text())
+
+        design = json.loads(json_output.getvalue())
+        self.assertEqual(len(design["parts"]), 5)
+        self.assertEqual(design["parts"][0]["pins"][0], {"number": "1", "name": "P1", "net": "VCC"})
+        self.assertEqual(design["nets"][0], {"name": "VCC", "pins": ["R1.1", "C1.1", "C2.1", "C3.1"]})
+
+        kicad = kicad_output.getvalue()
+        self.assertTrue(kicad.startswith("(export (version D)"))
+        self.assertIn('(comp (ref "C4") (value "1uF") (footprint "0603")', kicad)
+        self.assertIn('(net (code 2) (name "GND")\n      (node (ref "R1") (pin "2"))', kicad)
+        self.assertEqual(kicad.count("("), kicad.count(")"))
+
+        rows = list(csv.reader(io.StringIO(bom_output.getvalue())))
+        self.assertEqual(rows[0][:2], ["quantity", "refdes"])
+        self.assertEqual(rows[2][:3], ["3", "C1-C3", "100nF"])
+        self.assertEqual(rows[3][-1], "False")
+
+class VariantTest(DesignTestCase):
+    def setUp(self):
+        super().setUp()
+        r1, c1, c2, c3, c4 = self.context.parts_list
+        lite = self.context.new_variant("lite")
+        lite.depopulate(c2, c3)
+        lite.set_value(r1, "2k")
+        full = self.context.new_variant("full", base="lite")
+        full.populate(c2, c3, c4)
+
+    def test_variant(self):
+        r1, c1, c2, c3, c4 = self.context.parts_list
+        lite, full = self.context.variants["lite"], self.context.variants["full"]
+        self.assertEqual([lite.is_populated(part) for part in self.context.parts_list], [True, True, False, False, False])
+        self.assertEqual([full.is_populated(part) for part in self.context.parts_list], [True] * 5)
+        self.assertEqual(full.value(r1), "2k")
+        self.assertEqual(full.value(c1), "100nF")
+        self.assertEqual((r1.value, c2.populated), ("1kΩ", True), "the parts themselves stay the same")
+
+        with self.assertRaises(Exception):
+            self.context.new_variant("lite")
+        with self.assertRaises(KeyError):
+            lite.depopulate(R())
+
+    def export_boms(self, processes):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        bom_file = pathlib.Path(tmp_dir.name) / "%s.bom.csv"
+        results = export_variants(lambda name: [BOMSink(str(bom_file) % name), RecordingSink()],
+                                  self.context, processes=processes)
+        self.assertEqual(list(results), ["lite", "full"])
+        self.assertEqual(results["lite"][1], 10)
+        boms = {}
+        for name in results:
+            with open(str(bom_file) % name) as f:
+                boms[name] = list(csv.reader(f))
+        return boms
+
+    def test_export_variants(self):
+        boms = self.export_boms(processes=None)
+        self.assertEqual(boms["lite"][1][:3], ["1", "R1", "1kΩ"])
+        self.assertEqual(boms["lite"][1][4], "2k")
+        self.assertEqual(boms["lite"][3][:2], ["2", "C2, C3"])
+        self.assertEqual(boms["lite"][3][-1], "False")
+        self.assertEqual(len(boms["full"]), 4)
+
+        self.assertEqual(self.export_boms(processes=2), boms)
+
+if __name__ == "__main__":
+    unittest.main()
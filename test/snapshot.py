@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import pathlib
+import tempfile
+import unittest
+from pcbdl import *
+import pcbdl.snapshot
+
+def make_connector(pin_count):
+    class Connector(Part):
+        REFDES_PREFIX = "J"
+        PINS = [Pin(str(i + 1), "P%d" % (i + 1)) for i in range(pin_count)]
+    return Connector
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.filename = pathlib.Path(self.tmp_dir.name) / "design.snapshot"
+
+        self.context = Context("snapshot test")
+        with self.context:
+            vcc, gnd = Net("VCC"), Net("GND")
+            connector = make_connector(4)(refdes="J1", package="HDR4")
+            vcc << connector.P1 >> R("1k", refdes="R1").P1
+            gnd << (connector.P2, connector.P3)
+            connector.P4 << R("10k", refdes="R2", populated=False).P1 # anonymous net
+            C("1uF", refdes="C1", to=gnd)
+        self.context.autoname()
+
+        variant = self.context.new_variant("sku2")
+        variant.populate(self.context.parts_list[2])
+        variant.set_value(self.context.parts_list[1], "2k")
+
+    def test_roundtrip(self):
+        save_snapshot(self.filename, self.context)
+        loaded = load_snapshot(self.filename)
+
+        self.assertEqual(loaded.name, "snapshot test")
+        self.assertEqual(diff_netlists(self.context, loaded), [])
+        self.assertTrue(check_equivalence(self.context, loaded))
+        self.assertEqual([repr(part) for part in loaded.parts_list], ["J1", "R1", "R2", "C1"])
+
+        j1, r1, r2, c1 = loaded.parts_list
+        self.assertIsInstance(j1, Part)
+        self.assertEqual(j1.class_name, "make_connector.<locals>.Connector")
+        self.assertEqual(j1.package, "HDR4")
+        self.assertFalse(hasattr(r1, "package"))
+        self.assertFalse(r2.populated)
+        self.assertEqual(j1.P4.net, r2.P1.net)
+        self.assertEqual(loaded.named_nets["VCC"].grouped_connections, ((j1.P1, r1.P1),))
+        self.assertEqual(loaded.named_nets["GND"].grouped_connections, ((j1.P2, j1.P3), (c1.P2,)))
+        self.assertIsNone(c1.P1._net)
+
+        variant = loaded.variants["sku2"]
+        self.assertTrue(variant.is_populated(r2))
+        self.assertEqual(variant.value(r1), "2k")
+        self.assertEqual(variant.value(c1), c1.value)
+
+        outputs = []
+        for context in (self.context, loaded):
+            output = io.StringIO()
+            export([JSONSink(output), BOMSink(io.StringIO())], context, "sku2")
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_bad_file(self):
+        self.filename.write_bytes(b"something else entirely")
+        with self.assertRaises(pcbdl.snapshot.SnapshotError):
+            load_snapshot(self.filename)
+
+        save_snapshot(self.filename, self.context)
+        contents = bytearray(self.filename.read_bytes())
+        contents[8] = 99 # version
+        self.filename.write_bytes(contents)
+        with self.assertRaises(pcbdl.snapshot.SnapshotError):
+            load_snapshot(self.filename)
+
+    def test_truncated(self):
+        save_snapshot(self.filename, self.context)
+        contents = self.filename.read_bytes()
+        # at least a byte of real data is missing (the file ends in up to 7 bytes of padding)
+        for length in range(0, len(contents) - 8, 3):
+            self.filename.write_bytes(contents[:length])
+            with self.assertRaises(pcbdl.snapshot.SnapshotError, msg=length):
+                load_snapshot(self.filename)
+
+if __name__ == "__main__":
+    unittest.main()